@@ -1,38 +1,79 @@
+import contextlib
+
 import endpoints
-from google.appengine.api import memcache
-from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
 from protorpc import (
     remote,
     messages, message_types,
 )
 
+from models.aggregate import ActiveGamesShard, UserCounterShard
 from models.string import StringMessage
 from models.game import (
     Game,
     NewGameForm,
+    NewGameForms,
     GameForm,
     GameForms,
     GameHistory,
+    HintForm,
+    MoveForm,
+    MoveResultForm,
+    MoveResultForms,
 )
 from models.score import (
     Score,
+    ScoreForm,
     ScoreForms,
 )
+from models.stats import (
+    UserStats,
+    UserStatsForm,
+)
 from models.user import (
     User,
     UserForms,
 )
 
-from utils import get_by_urlsafe
+import cache
+import wordbank
+from engine import rules
+from engine.core import HangmanEngine
+from engine.errors import (
+    BadRequestError,
+    ConflictError,
+    EngineError,
+    ForbiddenError,
+    NotFoundError,
+)
+from engine.ndb_repository import NdbRepository
+from instrumentation import instrumented
+from utils import fetch_page, fetch_page_async, MAX_PAGE_SIZE
 
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 
 GET_GAME_REQUEST = endpoints.ResourceContainer(
-        urlsafe_game_key=messages.StringField(1), )
+        urlsafe_game_key=messages.StringField(1),
+        etag=messages.StringField(2), )
+
+GET_GAME_HISTORY_REQUEST = endpoints.ResourceContainer(
+        urlsafe_game_key=messages.StringField(1),
+        since=messages.IntegerField(2, default=0),
+        limit=messages.IntegerField(3),
+        etag=messages.StringField(4), )
 
 GET_USER_REQUEST = endpoints.ResourceContainer(
         user_name=messages.StringField(1), )
 
+PAGE_REQUEST = endpoints.ResourceContainer(
+        page_size=messages.IntegerField(1),
+        cursor=messages.StringField(2), )
+
+GET_USER_PAGE_REQUEST = endpoints.ResourceContainer(
+        user_name=messages.StringField(1),
+        page_size=messages.IntegerField(2),
+        cursor=messages.StringField(3), )
+
 GET_HIGH_SCORES_REQUEST = endpoints.ResourceContainer(
         number_of_results=messages.IntegerField(1), )
 
@@ -40,14 +81,42 @@ MAKE_MOVE_REQUEST = endpoints.ResourceContainer(
         urlsafe_game_key=messages.StringField(1),
         move=messages.StringField(2), )
 
+MAKE_MOVES_REQUEST = endpoints.ResourceContainer(
+        urlsafe_game_key=messages.StringField(1),
+        moves=messages.StringField(2, repeated=True), )
+
 NEW_GAME_REQUEST = endpoints.ResourceContainer(
         NewGameForm)
 
+NEW_GAMES_REQUEST = endpoints.ResourceContainer(
+        NewGameForms)
+
+MAX_NEW_GAMES = 1000
+
 USER_REQUEST = endpoints.ResourceContainer(
         user_name=messages.StringField(1),
         email=messages.StringField(2))
 
-MEMCACHE_MOVES_REMAINING = 'MOVES_REMAINING'
+# The game flow runs on the engine, over the datastore.
+_engine = HangmanEngine(NdbRepository())
+
+# The endpoints exception raised for each of the engine's exceptions.
+_ENDPOINTS_EXCEPTIONS = {
+    BadRequestError: endpoints.BadRequestException,
+    ConflictError: endpoints.ConflictException,
+    ForbiddenError: endpoints.ForbiddenException,
+    NotFoundError: endpoints.NotFoundException,
+}
+
+
+@contextlib.contextmanager
+def _engine_errors():
+    """Raises the endpoints exception of any EngineError raised in the block,
+    with the same message."""
+    try:
+        yield
+    except EngineError, e:
+        raise _ENDPOINTS_EXCEPTIONS[type(e)](e.args[0])
 
 
 @endpoints.api(name='hangman', version='v1')
@@ -59,6 +128,7 @@ class HangmanApi(remote.Service):
                       path='user',
                       name='create_user',
                       http_method='POST')
+    @instrumented
     def create_user(self, request):
         """Creates a User.
         Args:
@@ -73,24 +143,8 @@ class HangmanApi(remote.Service):
             endpoints.BadRequestException: If no email is provided.
             endpoints.ConflictException: If a user with that email already exists.
         """
-        if request.user_name is None:
-            raise endpoints.BadRequestException(
-                    'You must enter a user name to create a new user!')
-        elif User.query(User.name == request.user_name).get():
-            raise endpoints.ConflictException(
-                    'A User with username {} already exists!'.format(request.user_name))
-
-        if request.email is None:
-            raise endpoints.BadRequestException(
-                    'You must enter an email id to create a new user!')
-        elif User.query(User.email == request.email).get():
-            raise endpoints.ConflictException(
-                    'A User with email {} already exists!'.format(request.email))
-
-        # Create a new user with the user_name and email.
-        user = User(name=request.user_name, email=request.email)
-        # Add the user to the datastore with kind 'User'
-        user.put()
+        with _engine_errors():
+            _engine.create_user(request.user_name, request.email)
         return StringMessage(message='User {} created!'.format(
                 request.user_name))
 
@@ -99,72 +153,122 @@ class HangmanApi(remote.Service):
                       path='game',
                       name='new_game',
                       http_method='POST')
+    @instrumented
     def new_game(self, request):
         """Creates new Game.
         Args:
             request: The NEW_GAME_REQUEST object, which includes a user name
-                answer and optional attempts.
+                and optional answer and attempts. Without an answer, one is
+                picked from the word bank, of the optional length and
+                difficulty.
         Returns:
             StringMessage: A message that is sent to the client, saying that
                 the game has been created.
         Raises:
             endpoints.BadRequestException: If no user name is provided.
             endpoints.NotFoundException: If no user with user name exists.
-            endpoints.BadRequestException: If no answer is provided.
+            endpoints.BadRequestException: If the word bank has no word of
+                the requested length and difficulty.
             endpoints.BadRequestException: If the number of requests is <=0.
         """
-        if not request.user_name:
-            raise endpoints.BadRequestException(
-                    'You must enter a user name to create a new game')
+        answer = self._choose_answer(request)
+        with _engine_errors():
+            game = _engine.new_game(request.user_name, answer, int(request.attempts))
+        return game.to_form('Good luck playing Hangman!')
 
-        user = User.query(User.name == request.user_name).get()
-        # Raise an exception if the user is not found in the datastore.
-        if not user:
+    @endpoints.method(request_message=NEW_GAMES_REQUEST,
+                      response_message=GameForms,
+                      path='games',
+                      name='new_games',
+                      http_method='POST')
+    @instrumented
+    def new_games(self, request):
+        """Creates many new Games at once, for tournaments and load tests.
+        Args:
+            request: The NEW_GAMES_REQUEST object, which includes a user name
+                and optional answer and attempts for each game, as in
+                new_game.
+        Returns:
+            GameForms: The GameForm of each new game, in request order.
+        Raises:
+            endpoints.BadRequestException: If no games or more than MAX_NEW_GAMES
+                games are requested.
+            endpoints.BadRequestException: If a user name is missing.
+            endpoints.BadRequestException: If the word bank has no word for a
+                game without an answer.
+            endpoints.NotFoundException: If a user does not exist.
+            endpoints.BadRequestException: If a number of attempts is <=0.
+        """
+        if not request.items or len(request.items) > MAX_NEW_GAMES:
+            raise endpoints.BadRequestException(
+                    'You must enter between 1 and {} games!'.format(MAX_NEW_GAMES))
+        for item in request.items:
+            if not item.user_name:
+                raise endpoints.BadRequestException(
+                        'You must enter a user name for each game!')
+        answers = [self._choose_answer(item) for item in request.items]
+
+        users = User.get_by_names([item.user_name for item in request.items])
+        missing = set(item.user_name for item in request.items) - set(users)
+        if missing:
             raise endpoints.NotFoundException(
-                    'A User with name {} does not exist!'.format(request.user_name))
+                    'Users {} do not exist!'.format(', '.join(sorted(missing))))
 
-        if request.answer is None:
-            raise endpoints.BadRequestException(
-                    'You must enter an answer to create a new game!')
+        first, last = Game.allocate_ids(size=len(request.items))
         try:
-            game = Game.new_game(user.key, request.answer, int(request.attempts))
+            games = [Game.build(users[item.user_name].key, answer,
+                                int(item.attempts), key=ndb.Key(Game, game_id))
+                     for item, answer, game_id
+                     in zip(request.items, answers, xrange(first, last + 1))]
         except ValueError:
-            raise endpoints.BadRequestException('Number of attempts must be greater than 0!')
+            raise endpoints.BadRequestException(
+                    'Number of attempts must be between 1 and {}!'.format(rules.MAX_ATTEMPTS))
 
-        # Use a task queue to update the average attempts remaining.
-        # This operation is not needed to complete the creation of a new game
-        # so it is performed out of sequence.
-        taskqueue.add(url='/tasks/cache_average_attempts')
-        return game.to_form('Good luck playing Hangman!')
+        # The games and the running totals are written concurrently.
+        with cache.batch():
+            futures = ndb.put_multi_async(games) + [ActiveGamesShard.add_async(
+                    len(games), sum(game.attempts_remaining for game in games))]
+            for future in futures:
+                future.get_result()
+        return GameForms(items=[game.to_form('Good luck playing Hangman!')
+                                for game in games])
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
                       response_message=GameForm,
                       path='game/{urlsafe_game_key}',
                       name='get_game',
                       http_method='GET')
+    @instrumented
     def get_game(self, request):
         """Return the current game state..
         Args:
-            request: The GET_GAME_REQUEST object, which includes the game's urlsafe_game_key.
+            request: The GET_GAME_REQUEST object, which includes the game's urlsafe_game_key
+                and optionally the etag of the state the client already has.
         Returns:
-            GameForm: The GameForm with all the game's information.
+            GameForm: The GameForm with all the game's information, or only its etag and
+                not_modified if the etag is current.
         Raises:
             endpoints.NotFoundException: If no game is found.
         """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game:
-            if game.game_over is not True:
-                return game.to_form('You have {} attempts remaining'.
-                                    format(game.attempts_remaining))
-            return game.to_form('Game is over!')
-        else:
-            raise endpoints.NotFoundException('Game not found!')
+        if self._is_current(request.urlsafe_game_key, request.etag):
+            return GameForm(urlsafe_key=request.urlsafe_game_key, etag=request.etag,
+                            not_modified=True)
+        with _engine_errors():
+            game = _engine.get_game(request.urlsafe_game_key)
+        if request.etag == game.etag():
+            return GameForm(urlsafe_key=request.urlsafe_game_key, etag=request.etag,
+                            not_modified=True)
+        if game.game_over is not True:
+            return game.to_form('You have {} attempts remaining'.
+                                format(game.attempts_remaining))
+        return game.to_form('Game is over!')
 
     @endpoints.method(request_message=MAKE_MOVE_REQUEST,
                       response_message=GameForm,
                       path='game/{urlsafe_game_key}',
                       name='make_move',
                       http_method='PUT')
+    @instrumented
     def make_move(self, request):
         """Makes a move. Returns a game state with message
         Args:
@@ -175,78 +279,120 @@ class HangmanApi(remote.Service):
         Raises:
             endpoints.NotFoundException: If no game is found.
             endpoints.BadRequestException: If the user does not enter a single alphabet character.
+            endpoints.ConflictException: If another move changed the game first.
         """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if not game:
-            raise endpoints.NotFoundException('Game not found')
-        if game.game_over:
-            return game.to_form('Game is over!')
+        # The game is read through the entity cache. If the cached copy was
+        # stale, the engine finds out when saving and moves the stored game.
+        with _engine_errors():
+            game, message = _engine.make_move(request.urlsafe_game_key, request.move)
+        return game.to_form(message)
 
-        # Get the user who created the game from the datastore.
-        user = User.query(User.name == game.user.get().name).get()
+    @endpoints.method(request_message=MAKE_MOVES_REQUEST,
+                      response_message=MoveResultForms,
+                      path='game/{urlsafe_game_key}/moves',
+                      name='make_moves',
+                      http_method='PUT')
+    @instrumented
+    def make_moves(self, request):
+        """Makes a batch of moves in order, stopping when the game is over.
+        Args:
+            request: The MAKE_MOVES_REQUEST objects, which includes the game's
+                urlsafe_game_key and the user's ordered moves.
+        Returns:
+            MoveResultForms: The result message of each move that was applied and
+                the final GameForm.
+        Raises:
+            endpoints.NotFoundException: If no game is found.
+            endpoints.BadRequestException: If any move is not a single alphabet character.
+            endpoints.ConflictException: If another move changed the game first.
+        """
+        # All the moves are checked before any is applied, and the game is
+        # stored once.
+        with _engine_errors():
+            game, results = _engine.make_moves(request.urlsafe_game_key,
+                                               request.moves)
+        if results:
+            message = results[-1][1]
+        elif game.game_over:
+            message = 'Game is over!'
+        else:
+            message = 'You have {} attempts remaining'.format(game.attempts_remaining)
+        return MoveResultForms(game=game.to_form(message),
+                               results=[MoveResultForm(move=move, message=result)
+                                        for move, result in results])
 
-        # Raise an exception if the player enters multiple characters.
-        if not request.move or not request.move.isalpha() or len(list(request.move)) != 1:
+    @staticmethod
+    def _choose_answer(form):
+        """Returns the answer of a NewGameForm, picking one from the word bank
+        when the form has none.
+        Raises:
+            endpoints.BadRequestException: If the difficulty is unknown or the
+                word bank has no word of the length and difficulty.
+        """
+        if form.answer is not None:
+            return form.answer
+        difficulty = None
+        if form.difficulty is not None:
+            if form.difficulty not in wordbank.DIFFICULTIES:
+                raise endpoints.BadRequestException(
+                        'Difficulty must be one of {}!'.format(
+                                ', '.join(wordbank.DIFFICULTIES)))
+            difficulty = wordbank.DIFFICULTIES.index(form.difficulty)
+        answer = wordbank.get().choose(form.length, difficulty)
+        if answer is None:
             raise endpoints.BadRequestException(
-                    'You must enter a single alphanumeric character!'
-            )
-
-        # Check if the user has already entered the character.
-        if request.move not in game.answer:
-            game.attempts_remaining -= 1
-            if game.attempts_remaining == 0:
-                game.end_game(False)
-                user.total_played += 1
-                user.win_ratio = float("{0:.2f}".format(user.won / float(user.total_played)))
-                message = 'Game Over, You lose!'
-            else:
-                message = 'Wrong! You have {} attempts remaining!'.format(game.attempts_remaining)
-        # Notify the user that they have already entered a character.
-        elif request.move in game.user_answer:
-            return game.to_form('You already got the letter {}'.format(request.move))
-        else:
-            # Store the move in game.user_answer.
-            for i, x in enumerate(game.answer):
-                if x == request.move:
-                    game.user_answer[i] = request.move
-            if game.user_answer == game.answer:
-                user.won += 1
-                user.total_played += 1
-                user.win_ratio = float("{0:.2f}".format(user.won / float(user.total_played)))
-                game.end_game(True)
-                message = 'You win!'
-            else:
-                message = 'Correct! You got {}'.format(game.user_answer)
-
-        # Add game move history.
-        game.move_history.append(
-                ["Guess: {}, ".format(request.move) + "Result: {}".format(message)]
-        )
-
-        # Update the user and game entities in the datastore.
-        game.put()
-        user.put()
+                    'No word of that length and difficulty!')
+        return answer
 
-        return game.to_form(message)
+    @staticmethod
+    def _is_current(urlsafe_game_key, etag):
+        """Checks a client's etag against the cached version of a game,
+        without loading the game.
+        Args:
+            urlsafe_game_key: The game's urlsafe key.
+            etag: The etag the client has, or None.
+        Returns:
+            bool: True if the etag is the game's current one. False if it is
+                not, or the version is not cached.
+        """
+        if not etag:
+            return False
+        version = cache.get_version(urlsafe_game_key)
+        return version is not None and str(version) == etag
+
+    @staticmethod
+    def _score_form(score):
+        """Returns the ScoreForm of one of the engine's ScoreRecords."""
+        return ScoreForm(user_name=score.user_name, date=str(score.date),
+                         won=score.won, attempts_used=score.attempts_used,
+                         attempts=score.attempts)
 
-    @endpoints.method(response_message=ScoreForms,
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=ScoreForms,
                       path='scores',
                       name='get_scores',
                       http_method='GET')
+    @instrumented
     def get_scores(self, request):
-        """Return all scores.
+        """Return a page of all scores.
         Args:
-            request: None.
+            request: The PAGE_REQUEST object, which includes an optional
+                page_size and the cursor returned with the previous page.
         Returns:
-            ScoreForms: Multiple ScoreForm container.
+            ScoreForms: Multiple ScoreForm container with the next_cursor.
+        Raises:
+            endpoints.BadRequestException: If the page size or cursor is invalid.
         """
-        return ScoreForms(items=[score.to_form() for score in Score.query()])
+        scores, next_cursor = fetch_page(Score.query(), request.page_size,
+                                         request.cursor)
+        return ScoreForms(items=Score.to_forms(scores), next_cursor=next_cursor)
 
     @endpoints.method(request_message=GET_USER_REQUEST,
                       response_message=ScoreForms,
                       path='scores/user/{user_name}',
                       name='get_user_scores',
                       http_method='GET')
+    @instrumented
     def get_user_scores(self, request):
         """Returns all of the User's scores.
         Args:
@@ -257,16 +403,52 @@ class HangmanApi(remote.Service):
         Raises:
             endpoints.NotFoundException: If no user found.
         """
-        user = User.query(User.name == request.user_name).get()
+        if not request.user_name:
+            raise endpoints.NotFoundException(
+                    'A user with that name does not exist!')
+        # Users are keyed by name, so the user and their scores are fetched
+        # concurrently.
+        user_key = ndb.Key(User, request.user_name)
+        user_future = user_key.get_async()
+        scores_future = Score.query(Score.user == user_key).fetch_async()
+        user = user_future.get_result()
         # Raise an exception if a user with the user_name does not exist.
         if not user:
             raise endpoints.NotFoundException(
                     'A user with that name does not exist!')
 
-        # Fetch all the scores for the user from the datastore.
-        scores = Score.query(Score.user == user.key)
+        return ScoreForms(items=[score.to_form(user.name)
+                                 for score in scores_future.get_result()])
 
-        return ScoreForms(items=[score.to_form() for score in scores])
+    @endpoints.method(request_message=GET_USER_REQUEST,
+                      response_message=UserStatsForm,
+                      path='user/{user_name}/stats',
+                      name='get_user_stats',
+                      http_method='GET')
+    @instrumented
+    def get_user_stats(self, request):
+        """Returns the User's statistics over their finished games.
+        Args:
+            request: The GET_USER_REQUEST objects, which contains a users
+                name.
+        Returns:
+            UserStatsForm: The user's game, win, attempts and streak statistics.
+        Raises:
+            endpoints.NotFoundException: If no user found.
+        """
+        user = stats = None
+        if request.user_name:
+            # The user and their stats share the name as key, so one batch
+            # fetches both.
+            user, stats = ndb.get_multi([ndb.Key(User, request.user_name),
+                                         ndb.Key(UserStats, request.user_name)])
+        if not user:
+            raise endpoints.NotFoundException(
+                    'A user with that name does not exist!')
+        if not stats:
+            _, total_played, _ = UserCounterShard.counters([user])[user.name]
+            stats = UserStats(complete=total_played == 0)
+        return stats.to_form(user.name)
 
     @endpoints.method(request_message=message_types.VoidMessage,
                       response_message=StringMessage,
@@ -274,39 +456,55 @@ class HangmanApi(remote.Service):
                       name='get_average_attempts',
                       http_method='GET'
                       )
+    @instrumented
     def get_average_attempts(self, request):
-        """Get the cached average moves remaining
+        """Get the average moves remaining from the running totals
         Args:
             request: VoidMessage.
         Returns:
             StringMessage: A message that is sent to the client, mentioning the
             current average attempts remaining for the active games.
         """
-        return StringMessage(message=memcache.get(MEMCACHE_MOVES_REMAINING) or '')
+        average = _engine.get_average_attempts()
+        if average is None:
+            return StringMessage(message='')
+        return StringMessage(message='The average moves remaining is {:.2f}'.format(average))
 
-    @endpoints.method(request_message=USER_REQUEST,
+    @endpoints.method(request_message=GET_USER_PAGE_REQUEST,
                       response_message=GameForms,
                       path='user/{user_name}/games',
                       name='get_user_games',
                       http_method='GET'
                       )
+    @instrumented
     def get_user_games(self, request):
-        """Return all user's active games
+        """Return a page of the user's active games
         Args:
-            request: The USER_REQUEST objects, which includes a users
-                chosen name and an optional email.
+            request: The GET_USER_PAGE_REQUEST objects, which includes a users
+                chosen name, an optional page_size and the cursor returned
+                with the previous page.
         Returns:
-            GameForms: collection of GameForm with information about each game.
+            GameForms: collection of GameForm with information about each game
+                and the next_cursor.
         Raises:
             endpoints.BadRequestException: If no user for the user_name exists.
+            endpoints.BadRequestException: If the page size or cursor is invalid.
         """
-        if request.user_name is None:
+        if not request.user_name:
             raise endpoints.BadRequestException('You must enter a user name.')
-        user = User.query(User.name == request.user_name).get()
+        # Users are keyed by name, so the games query runs while the user is
+        # fetched.
+        user_key = ndb.Key(User, request.user_name)
+        user_future = user_key.get_async()
+        page_future = fetch_page_async(
+                Game.query(Game.user == user_key).filter(Game.game_over == False),
+                request.page_size, request.cursor)
+        user = user_future.get_result()
         if not user:
             raise endpoints.BadRequestException('The user {} does not exist!.'.format(request.user_name))
-        games = Game.query(Game.user == user.key).filter(Game.game_over == False)
-        return GameForms(items=[game.to_form('') for game in games])
+        games, next_cursor = page_future.get_result()
+        return GameForms(items=[game.to_form('') for game in games],
+                         next_cursor=next_cursor)
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
                       response_message=StringMessage,
@@ -314,6 +512,7 @@ class HangmanApi(remote.Service):
                       name='cancel_game',
                       http_method='DELETE'
                       )
+    @instrumented
     def cancel_game(self, request):
         """Cancel a game in progress.
         Args:
@@ -325,17 +524,10 @@ class HangmanApi(remote.Service):
             endpoints.ForbiddenException: If the user tries to delete a game that is already over.
             endpoints.NotFoundException: If no game is found.
         """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game:
-            if game.game_over:
-                raise endpoints.ForbiddenException('Illegal Action: Game is already over.')
-            else:
-                game.key.delete()
-                return StringMessage(message='Game with key {} deleted.'.
-                                     format(request.urlsafe_game_key))
-        else:
-            # Raise an exception if no such game is found in datastore.
-            raise endpoints.NotFoundException('Game not found!')
+        with _engine_errors():
+            _engine.cancel_game(request.urlsafe_game_key)
+        return StringMessage(message='Game with key {} deleted.'.
+                             format(request.urlsafe_game_key))
 
     @endpoints.method(request_message=GET_HIGH_SCORES_REQUEST,
                       response_message=ScoreForms,
@@ -343,6 +535,7 @@ class HangmanApi(remote.Service):
                       name='get_high_scores',
                       http_method='GET'
                       )
+    @instrumented
     def get_high_scores(self, request):
         """Generate a list of high scores in descending order, like a leader-board!.
         Args:
@@ -353,80 +546,133 @@ class HangmanApi(remote.Service):
             sorted by the minimum number of attempts used. In case of a tie, the game with
             higher number of maximum attempts is ranked higher.
         Raises:
+            endpoints.BadRequestException: If number_of_results is not greater than 0.
             endpoints.NotFoundException: If no scores are found for any games.
         """
         number_of_results = 10
         if request.number_of_results is not None:
             number_of_results = int(request.number_of_results)
-
-        # Fetch all the scores in descending order from the datastore.
-        # In case of tie in attempts used by the user, the game with more attempts allowed wins.
-        scores = Score.query(Score.won == True) \
-            .order(Score.attempts_used, -Score.attempts) \
-            .fetch(limit=number_of_results)
-        if not scores:
-            raise endpoints.NotFoundException(
-                    'No scores found for any users!'
-            )
-        return ScoreForms(items=[score.to_form() for score in scores])
-
-    @endpoints.method(request_message=message_types.VoidMessage,
+        # The repository serves the scores from the materialized leaderboard
+        # when it is deep enough. In case of tie in attempts used by the user,
+        # the game with more attempts allowed wins.
+        with _engine_errors():
+            scores = _engine.get_high_scores(number_of_results)
+        return ScoreForms(items=[self._score_form(score) for score in scores])
+
+    @endpoints.method(request_message=PAGE_REQUEST,
                       response_message=UserForms,
                       path='users/rankings',
                       name='get_user_rankings',
                       http_method='GET'
                       )
+    @instrumented
     def get_user_rankings(self, request):
-        """Get users win rate ranking.
+        """Get a page of the users win rate ranking.
         Args:
-            request: None.
+            request: The PAGE_REQUEST object, which includes an optional
+                page_size and the cursor returned with the previous page.
         Returns:
             UserForms: All the fields in UserForm that contains information about each user,
-            sorted by the highest win ratio. If 2 players have the same win ratio, the player
-            with fewer games played wins.
+            sorted by the highest win ratio, and the next_cursor. If 2 players have the same
+            win ratio, the player with fewer games played wins.
         Raises:
             endpoints.NotFoundException: If no users with wins > 0 can be found.
+            endpoints.BadRequestException: If the page size or cursor is invalid.
         """
-        users = User.query(User.win_ratio > 0.0).order(-User.win_ratio, User.total_played)
+        users, next_cursor = fetch_page(
+                User.query(User.win_ratio > 0.0).order(-User.win_ratio, User.total_played),
+                request.page_size, request.cursor)
         # Raise an exception if no users are found.
-        if not users:
+        if not users and not request.cursor:
             raise endpoints.NotFoundException('Cannot find any users!')
 
-        return UserForms(items=[user.to_form() for user in users])
-
-    @endpoints.method(request_message=GET_GAME_REQUEST,
+        # The ranking sorts by the counters last rolled up onto the Users;
+        # the forms show the exact ones.
+        counters = UserCounterShard.counters(users)
+        forms = []
+        for user in users:
+            form = user.to_form()
+            form.won, form.total_played, form.win_ratio = counters[user.name]
+            forms.append(form)
+        return UserForms(items=forms, next_cursor=next_cursor)
+
+    @endpoints.method(request_message=GET_GAME_HISTORY_REQUEST,
                       response_message=GameHistory,
                       path='game/{urlsafe_game_key}/history',
                       name='get_game_history',
                       http_method='GET'
                       )
+    @instrumented
     def get_game_history(self, request):
-        """Return user's move history for the game.
+        """Return a slice of user's move history for the game, so that clients
+        polling a game fetch only the moves after the last one they saw.
+        Args:
+            request: The GET_GAME_HISTORY_REQUEST object, which includes
+             the game's urlsafe_game_key, the number of the first move wanted
+             (since, 0 by default), an optional limit and optionally the etag of
+             the history the client already has.
+        Returns:
+            GameHistory: The moves from since on with the result of each, and
+                the number of moves in the whole history, or only the etag and
+                not_modified if the etag is current.
+        Raises:
+            endpoints.BadRequestException: If since is negative or limit is not
+                greater than 0.
+            endpoints.NotFoundException: If no game is found for the urlsafe_game_key.
+        """
+        limit = MAX_PAGE_SIZE if request.limit is None else min(request.limit,
+                                                                  MAX_PAGE_SIZE)
+        if request.since >= 0 and limit > 0 and \
+                self._is_current(request.urlsafe_game_key, request.etag):
+            return GameHistory(etag=request.etag, not_modified=True)
+
+        # The game loads only the stored history pages that overlap the slice.
+        with _engine_errors():
+            game, records = _engine.get_game_history(request.urlsafe_game_key,
+                                                     request.since, limit)
+        if request.etag == game.etag():
+            return GameHistory(etag=request.etag, not_modified=True)
+        return GameHistory(
+                items=[MoveForm(number=number, move=move, message=message,
+                                attempts_remaining=attempts_remaining)
+                       for number, move, message, attempts_remaining in records],
+                move_count=game.move_count,
+                etag=game.etag())
+
+    @endpoints.method(request_message=GET_GAME_REQUEST,
+                      response_message=HintForm,
+                      path='game/{urlsafe_game_key}/hint',
+                      name='get_hint',
+                      http_method='GET'
+                      )
+    @instrumented
+    def get_hint(self, request):
+        """Suggest the next move of a game: the letter that best splits the
+        word bank words matching the revealed pattern and the guesses so far.
         Args:
             request: The GET_GAME_REQUEST object, which includes
              the game's urlsafe_game_key.
         Returns:
-            GameHistory: The list of moves with the results for each move.
+            HintForm: The suggested move, if any, and the number of word bank
+                words still matching the game.
         Raises:
             endpoints.NotFoundException: If no game is found for the urlsafe_game_key.
         """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game:
-            return GameHistory(move=str(game.move_history))
-        else:
-            raise endpoints.NotFoundException('Game not Found!')
-
-    @staticmethod
-    def _cache_average_attempts():
-        """Populates memcache with the average moves remaining of Games."""
-        games = Game.query(Game.game_over == False)
-        if games:
-            count = games.count()
-            total_attempts_remaining = sum([game.attempts_remaining
-                                            for game in games])
-            average = total_attempts_remaining / float(count)
-            memcache.set(MEMCACHE_MOVES_REMAINING,
-                         'The average moves remaining is {:.2f}'.format(average))
+        with _engine_errors():
+            game = _engine.get_game(request.urlsafe_game_key)
+        if game.game_over:
+            return HintForm(candidates=0, message='Game is over!')
+
+        # Imported here so that NumPy and the solver's matrices only load on
+        # instances that serve hints.
+        import hints
+        guessed = set(letter for letter, _, _ in game.full_history())
+        move, candidates = hints.get().hint(game.user_answer, guessed)
+        if move is None:
+            return HintForm(candidates=candidates,
+                            message='No hint available for this word!')
+        return HintForm(move=move, candidates=candidates,
+                        message='Try the letter {}'.format(move))
 
 
 api = endpoints.api_server([HangmanApi])
@@ -0,0 +1,96 @@
+"""archival.py - This file contains the archival of old Games. Finished games
+are moved to ArchivedGame once FINISHED_GAME_TTL_DAYS have passed since their
+last move, and active games idle for IDLE_GAME_TTL_DAYS are expired the same
+way, so the Game indexes only hold recent games. Each call archives one page
+of games, read from the Game(game_over, last_move) index, and returns the
+cursor of the next page so the task handlers in main.py can chain them."""
+
+from datetime import datetime, timedelta
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+import cache
+import settings
+from models.aggregate import ActiveGamesShard
+from models.archive import ArchivedGame
+from models.game import Game
+
+ARCHIVE_BATCH_SIZE = 100
+
+
+def archive_games(expired, urlsafe_cursor=None):
+    """Archives one page of old games.
+    Args:
+        expired: True to expire idle active games, False to archive finished
+            games.
+        urlsafe_cursor: The cursor returned for the previous page, or None to
+            start from the first page.
+    Returns:
+        The urlsafe cursor of the next page, or None when done.
+    """
+    ttl = settings.IDLE_GAME_TTL_DAYS if expired else settings.FINISHED_GAME_TTL_DAYS
+    cutoff = datetime.now() - timedelta(days=ttl)
+    cursor = Cursor(urlsafe=urlsafe_cursor) if urlsafe_cursor else None
+    games, next_cursor, more = Game.query(
+            Game.game_over == (not expired), Game.last_move < cutoff).fetch_page(
+            ARCHIVE_BATCH_SIZE, start_cursor=cursor)
+    if games:
+        _archive(games, expired)
+    if not more or not next_cursor:
+        return None
+    return next_cursor.urlsafe()
+
+
+def _archive(games, expired):
+    """Writes the archives of a batch of games, then deletes the games and
+    their history pages in one batch. Re-running a batch rewrites the same
+    archives, so an interrupted batch is safe to retry. Idle games may still
+    take a move, so each is expired in its own transaction instead."""
+    if expired:
+        futures = [_expire_async(game) for game in games]
+        games = [game for game, future in zip(games, futures) if future.get_result()]
+        if games:
+            ActiveGamesShard.add(-len(games),
+                                 -sum(game.attempts_remaining for game in games))
+        return
+
+    page_keys = [key for game in games for key in game.history_page_keys()]
+    pages = dict((page.key, page) for page in ndb.get_multi(page_keys) if page)
+
+    archives = []
+    for game in games:
+        moves = []
+        for key in game.history_page_keys():
+            if key in pages:
+                moves.extend(pages[key].moves)
+        moves.extend(game.history())
+        archives.append(ArchivedGame.from_game(game, moves, expired))
+    ndb.put_multi(archives)
+
+    with cache.batch():
+        ndb.delete_multi([game.key for game in games] + page_keys)
+
+
+@ndb.transactional_tasklet(xg=True)
+def _expire_async(game):
+    """Archives and deletes an idle game unless it was moved, finished or
+    cancelled since it was queried, checked against its version in the
+    transaction as save_move does.
+    Args:
+        game: The idle Game, as queried.
+    Returns:
+        True if the game was expired.
+    """
+    stored = yield game.key.get_async(use_cache=False)
+    if stored is None or stored.game_over or stored.version != game.version:
+        raise ndb.Return(False)
+    page_keys = stored.history_page_keys()
+    moves = []
+    for page in (yield ndb.get_multi_async(page_keys)):
+        if page:
+            moves.extend(page.moves)
+    moves.extend(stored.history())
+    yield [ArchivedGame.from_game(stored, moves, True).put_async()] + \
+        ndb.delete_multi_async([stored.key] + page_keys)
+    raise ndb.Return(True)
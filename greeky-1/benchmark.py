@@ -0,0 +1,519 @@
+#!/usr/bin/env python
+"""benchmark.py - This file contains the load-generation and latency benchmark
+of the Hangman API. It simulates a population of players creating games,
+guessing letters drawn from English letter frequencies and reading the
+leaderboards, and reports the throughput, latency percentiles and storage
+RPCs of each endpoint.
+
+The players run interleaved in a single thread from a fixed seed, so two runs
+with the same options issue the same requests in the same order.
+
+Backends:
+    api (default): HangmanApi through its SPI routes, on the App Engine
+        testbed stubs, running the tasks it enqueues after each call.
+        Requires the App Engine SDK (--sdk or $APPENGINE_SDK).
+    memory: HangmanEngine over engine.memory.MemoryRepository.
+    sqlite: HangmanEngine over engine.sqlite.SqliteRepository.
+        The engine backends time the game rules without App Engine. They do
+        not run HangmanApi, its caches or its datastore writes, so their
+        numbers say nothing about the API and are not comparable to the api
+        backend.
+
+Usage:
+    python benchmark.py --players 50 --output base.json
+    python benchmark.py --players 50 --output new.json
+    python benchmark.py --compare base.json new.json
+"""
+
+import argparse
+import bisect
+import collections
+import json
+import os
+import random
+import sys
+import timeit
+
+from wordbank import LETTER_FREQUENCIES
+
+DEFAULT_PLAYERS = 20
+DEFAULT_GAMES_PER_PLAYER = 5
+DEFAULT_SEED = 1
+# Chance that a player reads a leaderboard after each move.
+DEFAULT_READ_RATIO = 0.1
+# Relative increase of a latency percentile or RPC count that --compare
+# reports as a regression.
+DEFAULT_THRESHOLD = 0.1
+
+PERCENTILES = (50, 95, 99)
+
+WORDS = (
+    'python', 'hangman', 'endpoint', 'datastore', 'memcache', 'cursor',
+    'leaderboard', 'queue', 'shard', 'transaction', 'entity', 'index',
+    'latency', 'throughput', 'quartz', 'jazz', 'rhythm', 'sphinx', 'oxygen',
+    'galaxy', 'puzzle', 'zephyr', 'banana', 'mississippi', 'keyboard',
+    'question', 'answer', 'letter', 'window', 'engine', 'benchmark',
+    'velocity', 'kayak', 'jukebox', 'wizard', 'voyage', 'buffalo', 'crypt',
+)
+
+
+class Recorder(object):
+    """Collects the latency and storage RPCs of each endpoint call."""
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.rpcs = collections.defaultdict(collections.Counter)
+        self._current = None
+        # Called untimed after every call, such as ApiTarget.run_tasks.
+        self.after_call = None
+
+    def rpc(self, name):
+        """Counts an RPC against the endpoint being called, if any."""
+        if self._current:
+            self.rpcs[self._current][name] += 1
+
+    def call(self, endpoint, function, *args):
+        """Calls and times an endpoint.
+        Returns:
+            The result of the function, or None if it raised an expected
+            error, which is counted against the endpoint.
+        """
+        self._current = endpoint
+        start = timeit.default_timer()
+        try:
+            return function(*args)
+        except ExpectedError:
+            self.errors[endpoint] += 1
+            return None
+        finally:
+            self.latencies[endpoint].append(timeit.default_timer() - start)
+            self._current = None
+            if self.after_call:
+                self.after_call()
+
+    def report(self, elapsed):
+        """Returns the results as a JSON serializable dict. The throughput of
+        each endpoint is its calls per second of the whole run.
+        Args:
+            elapsed: The wall time of the whole run, in seconds.
+        """
+        endpoints = {}
+        for endpoint, latencies in self.latencies.iteritems():
+            latencies = sorted(latencies)
+            calls = len(latencies)
+            stats = {
+                'calls': calls,
+                'errors': self.errors[endpoint],
+                'mean_ms': sum(latencies) / calls * 1000,
+                'throughput': calls / elapsed if elapsed else 0.0,
+                'rpcs_per_call': dict((name, count / float(calls)) for name, count
+                                      in self.rpcs[endpoint].iteritems()),
+            }
+            for percentile in PERCENTILES:
+                stats['p{}_ms'.format(percentile)] = \
+                    _percentile(latencies, percentile) * 1000
+            endpoints[endpoint] = stats
+        calls = sum(len(latencies) for latencies in self.latencies.itervalues())
+        return {
+            'elapsed_s': elapsed,
+            'calls': calls,
+            'throughput': calls / elapsed if elapsed else 0.0,
+            'endpoints': endpoints,
+        }
+
+
+class ExpectedError(Exception):
+    """An endpoint error that the simulated players can trigger, such as
+    reading the high scores before anyone has won."""
+
+
+class EngineTarget(object):
+    """Runs the players against HangmanEngine, counting repository calls as
+    the storage RPCs. Measures the engine only, not HangmanApi."""
+
+    def __init__(self, repository, recorder):
+        from engine.core import HangmanEngine
+        self.engine = HangmanEngine(_CountingRepository(repository, recorder))
+
+    def create_user(self, name, email):
+        with _engine_errors():
+            self.engine.create_user(name, email)
+
+    def new_game(self, user_name, answer, attempts):
+        with _engine_errors():
+            return self.engine.new_game(user_name, answer, attempts).id
+
+    def make_move(self, game_id, letter):
+        with _engine_errors():
+            game, _ = self.engine.make_move(game_id, letter)
+            return game.game_over
+
+    def get_game_history(self, game_id):
+        with _engine_errors():
+            return self.engine.get_game_history(game_id)
+
+    def get_user_games(self, user_name):
+        with _engine_errors():
+            return self.engine.get_user_games(user_name)
+
+    def get_high_scores(self, number_of_results):
+        with _engine_errors():
+            return self.engine.get_high_scores(number_of_results)
+
+    def get_user_rankings(self):
+        with _engine_errors():
+            return self.engine.get_user_rankings()
+
+    def get_average_attempts(self):
+        with _engine_errors():
+            return self.engine.get_average_attempts()
+
+
+class _CountingRepository(object):
+    """Proxy of a Repository that counts the calls of each method."""
+
+    def __init__(self, repository, recorder):
+        self._repository = repository
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        method = getattr(self._repository, name)
+
+        def counted(*args, **kwargs):
+            self._recorder.rpc(name)
+            return method(*args, **kwargs)
+        return counted
+
+
+class _engine_errors(object):
+    """Context manager turning the engine's exceptions into ExpectedError."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        from engine.errors import EngineError
+        if exc_type is not None and issubclass(exc_type, EngineError):
+            raise ExpectedError(str(exc_value))
+        return False
+
+
+class ApiTarget(object):
+    """Runs the players against HangmanApi through its SPI routes, on the
+    testbed stubs, counting the App Engine API calls as the storage RPCs.
+    The tasks each call enqueues are run after it, untimed, so the stats and
+    the leaderboard are kept up to date as in production."""
+
+    def __init__(self, recorder):
+        from google.appengine.api import apiproxy_stub_map
+        from google.appengine.datastore import datastore_stub_util
+        from google.appengine.ext import ndb
+        from google.appengine.ext import testbed
+        import webtest
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        # Endpoints reads the app revision from the version id.
+        self.testbed.setup_env(current_version_id='benchmark.1', overwrite=True)
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(
+                root_path=os.path.dirname(os.path.abspath(__file__)))
+        self.testbed.init_mail_stub()
+        self.testbed.init_app_identity_stub()
+
+        def hook(service, call, request, response):
+            recorder.rpc('{}.{}'.format(service, call))
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('benchmark', hook)
+
+        import api
+        import main
+        # The SPI routes only answer the Endpoints frontend or a dev server.
+        self.app = webtest.TestApp(api.api, extra_environ={
+                'SERVER_SOFTWARE': 'Development/benchmark'})
+        self.tasks_app = webtest.TestApp(main.app)
+        self.taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        self.ndb = ndb
+
+    def close(self):
+        self.testbed.deactivate()
+
+    def _call(self, method, **fields):
+        # A new in-context cache for every request, as in production.
+        self.ndb.get_context().clear_cache()
+        response = self.app.post_json('/_ah/spi/HangmanApi.{}'.format(method),
+                                      fields, expect_errors=True)
+        if response.status_int >= 500:
+            raise RuntimeError('{} failed: {}'.format(method, response.body))
+        if response.status_int >= 400:
+            raise ExpectedError(response.body)
+        return response.json
+
+    def run_tasks(self):
+        """Runs the queued tasks, and the tasks they enqueue, until the
+        queue is empty."""
+        tasks = self.taskqueue.get_filtered_tasks()
+        while tasks:
+            self.taskqueue.FlushQueue('default')
+            for task in tasks:
+                self.ndb.get_context().clear_cache()
+                self.tasks_app.post(task.url, task.payload, headers=task.headers)
+            tasks = self.taskqueue.get_filtered_tasks()
+
+    def create_user(self, name, email):
+        self._call('create_user', user_name=name, email=email)
+
+    def new_game(self, user_name, answer, attempts):
+        return self._call('new_game', user_name=user_name, answer=answer,
+                          attempts=attempts)['urlsafe_key']
+
+    def make_move(self, game_id, letter):
+        return self._call('make_move', urlsafe_game_key=game_id,
+                          move=letter)['game_over']
+
+    def get_game_history(self, game_id):
+        return self._call('get_game_history', urlsafe_game_key=game_id)
+
+    def get_user_games(self, user_name):
+        return self._call('get_user_games', user_name=user_name)
+
+    def get_high_scores(self, number_of_results):
+        return self._call('get_high_scores', number_of_results=number_of_results)
+
+    def get_user_rankings(self):
+        return self._call('get_user_rankings')
+
+    def get_average_attempts(self):
+        return self._call('get_average_attempts')
+
+
+class Player(object):
+    """A simulated player, guessing the letters of each game in an order
+    drawn from the English letter frequencies."""
+
+    def __init__(self, name, rng):
+        self.name = name
+        self.rng = rng
+        self.game_id = None
+        self.guesses = []
+        self.games_played = 0
+
+    def start_game(self, game_id):
+        self.game_id = game_id
+        self.guesses = _frequency_order(self.rng)
+        self.games_played += 1
+
+    def next_guess(self):
+        return self.guesses.pop(0)
+
+
+def run(target, recorder, players=DEFAULT_PLAYERS,
+        games_per_player=DEFAULT_GAMES_PER_PLAYER, read_ratio=DEFAULT_READ_RATIO,
+        attempts=None, seed=DEFAULT_SEED):
+    """Runs the simulation to completion.
+    Args:
+        target: The EngineTarget or ApiTarget to call.
+        recorder: The Recorder of the calls.
+        players: The number of simulated players.
+        games_per_player: The number of games each player finishes.
+        read_ratio: The chance that a player reads a leaderboard after a move.
+        attempts: The attempts of each game, or None for the default.
+        seed: The seed of the simulation.
+    Returns:
+        The wall time of the run, in seconds.
+    """
+    rng = random.Random(seed)
+    start = timeit.default_timer()
+    population = [Player('player{}'.format(i), random.Random(rng.random()))
+                  for i in range(players)]
+    for player in population:
+        recorder.call('create_user', target.create_user, player.name,
+                      '{}@example.com'.format(player.name))
+
+    active = list(population)
+    while active:
+        player = rng.choice(active)
+        if player.game_id is None:
+            game_id = recorder.call('new_game', target.new_game, player.name,
+                                    rng.choice(WORDS), attempts)
+            if game_id is None:
+                active.remove(player)
+            else:
+                player.start_game(game_id)
+            continue
+
+        game_over = recorder.call('make_move', target.make_move, player.game_id,
+                                  player.next_guess())
+        if rng.random() < read_ratio:
+            _read(target, recorder, player, rng)
+        if game_over or not player.guesses:
+            recorder.call('get_game_history', target.get_game_history,
+                          player.game_id)
+            player.game_id = None
+            if player.games_played >= games_per_player:
+                active.remove(player)
+    return timeit.default_timer() - start
+
+
+def _read(target, recorder, player, rng):
+    """Makes one of the read-only calls a player makes between moves."""
+    choice = rng.random()
+    if choice < 0.4:
+        recorder.call('get_high_scores', target.get_high_scores, 10)
+    elif choice < 0.6:
+        recorder.call('get_user_rankings', target.get_user_rankings)
+    elif choice < 0.8:
+        recorder.call('get_average_attempts', target.get_average_attempts)
+    else:
+        recorder.call('get_user_games', target.get_user_games, player.name)
+
+
+def _frequency_order(rng):
+    """Returns the alphabet in a random order weighted by letter frequency,
+    the order in which a player guesses."""
+    letters = sorted(LETTER_FREQUENCIES)
+    order = []
+    while letters:
+        weights = [LETTER_FREQUENCIES[letter] for letter in letters]
+        totals = [sum(weights[:i + 1]) for i in range(len(weights))]
+        i = bisect.bisect(totals, rng.random() * totals[-1])
+        order.append(letters.pop(min(i, len(letters) - 1)))
+    return order
+
+
+def _percentile(values, percentile):
+    """Returns the nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    rank = int(round(percentile / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def compare(base, current, threshold=DEFAULT_THRESHOLD):
+    """Compares two reports.
+    Args:
+        base: The report of the baseline run.
+        current: The report of the run to check.
+        threshold: The relative increase reported as a regression.
+    Returns:
+        A tuple of the printable lines of the comparison and the list of
+        (endpoint, metric) that regressed.
+    """
+    lines = ['{:<22} {:<28} {:>10} {:>10} {:>8}'.format(
+            'endpoint', 'metric', 'base', 'current', 'change')]
+    regressions = []
+    for endpoint in sorted(set(base['endpoints']) | set(current['endpoints'])):
+        old = base['endpoints'].get(endpoint)
+        new = current['endpoints'].get(endpoint)
+        if not old or not new:
+            lines.append('{:<22} {}'.format(
+                    endpoint, 'only in current' if new else 'only in base'))
+            continue
+        metrics = [('p{}_ms'.format(p), old['p{}_ms'.format(p)],
+                    new['p{}_ms'.format(p)]) for p in PERCENTILES]
+        for rpc in sorted(set(old['rpcs_per_call']) | set(new['rpcs_per_call'])):
+            metrics.append(('rpcs ' + rpc, old['rpcs_per_call'].get(rpc, 0.0),
+                            new['rpcs_per_call'].get(rpc, 0.0)))
+        for metric, old_value, new_value in metrics:
+            change = (new_value - old_value) / old_value if old_value else \
+                (float('inf') if new_value else 0.0)
+            flag = ''
+            if change > threshold:
+                regressions.append((endpoint, metric))
+                flag = ' !'
+            lines.append('{:<22} {:<28} {:>10.3f} {:>10.3f} {:>+7.0%}{}'.format(
+                    endpoint, metric, old_value, new_value, change, flag))
+    return lines, regressions
+
+
+def _print_report(report):
+    if report['options']['backend'] != 'api':
+        print('{} backend: HangmanEngine only, not representative of the '
+              'API'.format(report['options']['backend']))
+    print('{} calls in {:.2f}s, {:.1f} calls/s'.format(
+            report['calls'], report['elapsed_s'], report['throughput']))
+    print('{:<22} {:>7} {:>6} {:>10} {:>9} {:>9} {:>9}  {}'.format(
+            'endpoint', 'calls', 'errors', 'calls/s', 'p50 ms', 'p95 ms', 'p99 ms',
+            'rpcs/call'))
+    for endpoint, stats in sorted(report['endpoints'].iteritems()):
+        rpcs = ', '.join('{} {:.2f}'.format(name, count) for name, count
+                         in sorted(stats['rpcs_per_call'].iteritems()))
+        print('{:<22} {:>7} {:>6} {:>10.1f} {:>9.3f} {:>9.3f} {:>9.3f}  {}'.format(
+                endpoint, stats['calls'], stats['errors'], stats['throughput'],
+                stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], rpcs))
+
+
+def _setup_sdk(sdk):
+    """Puts the App Engine SDK and its bundled libraries on the path."""
+    if not sdk:
+        sys.exit('The api backend needs the App Engine SDK: pass --sdk or set '
+                 'APPENGINE_SDK.')
+    sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=('api', 'memory', 'sqlite'),
+                        default='api',
+                        help='api times HangmanApi; memory and sqlite time '
+                             'the engine only, not the API.')
+    parser.add_argument('--players', type=int, default=DEFAULT_PLAYERS)
+    parser.add_argument('--games-per-player', type=int,
+                        default=DEFAULT_GAMES_PER_PLAYER)
+    parser.add_argument('--read-ratio', type=float, default=DEFAULT_READ_RATIO)
+    parser.add_argument('--attempts', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--sqlite-path', default=':memory:')
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'))
+    parser.add_argument('--output', help='Writes the report as JSON to a file.')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'CURRENT'),
+                        help='Compares two JSON reports instead of running.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as base, open(args.compare[1]) as current:
+            lines, regressions = compare(json.load(base), json.load(current),
+                                         args.threshold)
+        print('\n'.join(lines))
+        if regressions:
+            print('{} regressions over {:.0%}'.format(len(regressions), args.threshold))
+            return 1
+        return 0
+
+    recorder = Recorder()
+    if args.backend == 'api':
+        _setup_sdk(args.sdk)
+        target = ApiTarget(recorder)
+        recorder.after_call = target.run_tasks
+    elif args.backend == 'sqlite':
+        from engine.sqlite import SqliteRepository
+        target = EngineTarget(SqliteRepository(args.sqlite_path), recorder)
+    else:
+        from engine.memory import MemoryRepository
+        target = EngineTarget(MemoryRepository(), recorder)
+
+    try:
+        elapsed = run(target, recorder, args.players, args.games_per_player,
+                      args.read_ratio, args.attempts, args.seed)
+    finally:
+        if isinstance(target, ApiTarget):
+            target.close()
+
+    report = recorder.report(elapsed)
+    report['options'] = dict((name, getattr(args, name)) for name in (
+            'backend', 'players', 'games_per_player', 'read_ratio', 'attempts',
+            'seed'))
+    _print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""cache.py - Two-tier cache of entities keyed by urlsafe key: a bounded
+per-instance LRU with a TTL in front of memcache. Entries are stored as
+encoded protocol buffers, so every hit returns a fresh entity that callers can
+mutate freely. The version of an entity that has one is also cached on its
+own, so that conditional reads can be answered without the entity."""
+
+import collections
+import contextlib
+import threading
+import time
+
+from google.appengine.api import memcache
+from google.appengine.datastore import entity_pb
+from google.appengine.ext import ndb
+
+import instrumentation
+
+LOCAL_CACHE_SIZE = 1000
+# Short, as other instances only invalidate the memcache tier.
+LOCAL_CACHE_TTL = 2
+MEMCACHE_TTL = 3600
+MEMCACHE_PREFIX = 'entity:'
+VERSION_PREFIX = 'version:'
+
+
+class LRUCache(object):
+    """A thread-safe, size bounded LRU cache whose entries expire after a
+    fixed number of seconds."""
+
+    def __init__(self, size, ttl):
+        self._size = size
+        self._ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the live value cached for key, or None."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                return None
+            # Re-insert to mark the entry as the most recently used.
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value):
+        """Caches value under key, evicting the least recently used entry if
+        the cache is full."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + self._ttl)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Drops key from the cache."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_local = LRUCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL)
+# Converts entities to and from protocol buffers by kind.
+_adapter = ndb.ModelAdapter()
+_counters = collections.Counter()
+_counters_lock = threading.Lock()
+# Memcache writes and deletes deferred by the batch() of the current request
+# thread.
+_pending = threading.local()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+    instrumentation.count_cache(name)
+
+
+def get(urlsafe):
+    """Returns the entity cached for a urlsafe key, checking the local tier
+    before memcache, or None on a miss."""
+    data = _local.get(urlsafe)
+    if data is not None:
+        _count('local_hits')
+    else:
+        _count('local_misses')
+        data = memcache.get(MEMCACHE_PREFIX + urlsafe)
+        if data is None:
+            _count('memcache_misses')
+            return None
+        _count('memcache_hits')
+        _local.set(urlsafe, data)
+    return _adapter.pb_to_entity(entity_pb.EntityProto(data))
+
+
+def get_version(urlsafe):
+    """Returns the version cached for the entity with a urlsafe key, checking
+    the local tier before memcache, or None on a miss. Versions are cached
+    apart from the entities, so a conditional read fetches a few bytes."""
+    key = VERSION_PREFIX + urlsafe
+    version = _local.get(key)
+    if version is None:
+        version = memcache.get(key)
+        if version is not None:
+            _local.set(key, version)
+    return version
+
+
+def set(entity):
+    """Writes an entity, and its version if it has one, through both tiers."""
+    urlsafe = entity.key.urlsafe()
+    data = _adapter.entity_to_pb(entity).Encode()
+    _local.set(urlsafe, data)
+    entries = {MEMCACHE_PREFIX + urlsafe: data}
+    version = getattr(entity, 'version', None)
+    if version is not None:
+        _local.set(VERSION_PREFIX + urlsafe, version)
+        entries[VERSION_PREFIX + urlsafe] = version
+    writes = getattr(_pending, 'writes', None)
+    if writes is not None:
+        writes.update(entries)
+        _pending.deletes.difference_update(entries)
+    else:
+        memcache.set_multi(entries, time=MEMCACHE_TTL)
+
+
+@contextlib.contextmanager
+def batch():
+    """Defers the memcache writes of every set() and delete() inside the
+    block to a single set_multi and delete_multi when the block exits."""
+    _pending.writes = {}
+    _pending.deletes = set()
+    try:
+        yield
+    finally:
+        writes, _pending.writes = _pending.writes, None
+        deletes, _pending.deletes = _pending.deletes, None
+        if writes:
+            memcache.set_multi(writes, time=MEMCACHE_TTL)
+        if deletes:
+            memcache.delete_multi(list(deletes))
+
+
+def delete(urlsafe):
+    """Invalidates the entity and version cached for a urlsafe key in both
+    tiers."""
+    keys = [MEMCACHE_PREFIX + urlsafe, VERSION_PREFIX + urlsafe]
+    _local.delete(urlsafe)
+    _local.delete(VERSION_PREFIX + urlsafe)
+    deletes = getattr(_pending, 'deletes', None)
+    if deletes is not None:
+        deletes.update(keys)
+        for key in keys:
+            _pending.writes.pop(key, None)
+    else:
+        memcache.delete_multi(keys)
+
+
+def stats():
+    """Returns the hit and miss counters of this instance."""
+    with _counters_lock:
+        return dict(_counters)
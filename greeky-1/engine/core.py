@@ -0,0 +1,249 @@
+"""core.py - This file contains HangmanEngine, the game flow of the Hangman
+API on top of a storage-agnostic Repository. HangmanApi runs it over
+engine.ndb_repository, and the benchmark and tests over the memory and SQLite
+repositories, so the hot paths can be exercised and profiled without the App
+Engine runtime."""
+
+from datetime import date
+
+from engine import rules
+from engine.errors import (
+    BadRequestError,
+    ConflictError,
+    ForbiddenError,
+    NotFoundError,
+)
+from engine.state import PlayerState, ScoreRecord
+
+
+class HangmanEngine(object):
+    """Hangman game flow over a Repository."""
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    def create_user(self, name, email):
+        """Creates a player.
+        Args:
+            name: The player's unique name.
+            email: The player's unique email.
+        Returns:
+            PlayerState: The new player.
+        Raises:
+            BadRequestError: If the name or email is missing.
+            ConflictError: If the name or email is taken.
+        """
+        if not name:
+            raise BadRequestError('You must enter a user name to create a new user!')
+        if email is None:
+            raise BadRequestError('You must enter an email id to create a new user!')
+        player = PlayerState(name, email)
+        self.repository.add_player(player)
+        return player
+
+    def new_game(self, user_name, answer, attempts=None):
+        """Creates a game.
+        Args:
+            user_name: The name of the player.
+            answer: The answer for the game.
+            attempts: The maximum number of attempts allowed.
+        Returns:
+            The new game record, with its id set.
+        Raises:
+            BadRequestError: If the user name or answer is missing, or
+                attempts is not between 1 and rules.MAX_ATTEMPTS.
+            NotFoundError: If the player does not exist.
+        """
+        if not user_name:
+            raise BadRequestError('You must enter a user name to create a new game')
+        if not self.repository.get_player(user_name):
+            raise NotFoundError('A User with name {} does not exist!'.format(user_name))
+        if answer is None:
+            raise BadRequestError('You must enter an answer to create a new game!')
+        game = self.repository.build_game(user_name)
+        try:
+            rules.start_game(game, answer, attempts)
+        except ValueError:
+            raise BadRequestError('Number of attempts must be between 1 and {}!'.format(
+                    rules.MAX_ATTEMPTS))
+        self.repository.add_game(game)
+        return game
+
+    def get_game(self, game_id, cached=True):
+        """Returns a game record.
+        Args:
+            game_id: The id of the game.
+            cached: False to bypass any cache of the repository.
+        Raises:
+            NotFoundError: If the game does not exist.
+        """
+        game = self.repository.get_game(game_id, cached)
+        if not game:
+            raise NotFoundError('Game not found!')
+        return game
+
+    def get_game_history(self, game_id, since=0, limit=None):
+        """Returns a slice of the move history of a game.
+        Args:
+            game_id: The id of the game.
+            since: The number of the first move wanted, counting from 0.
+            limit: The maximum number of moves wanted, or None for all.
+        Returns:
+            A tuple of the game record and a list of (number, letter, message,
+            attempts_remaining) records.
+        Raises:
+            NotFoundError: If the game does not exist.
+            BadRequestError: If since is negative or limit is not over 0.
+        """
+        if since < 0:
+            raise BadRequestError('since must not be negative!')
+        if limit is not None and limit <= 0:
+            raise BadRequestError('limit must be greater than 0!')
+        game = self.get_game(game_id)
+        if limit is None:
+            limit = game.move_count
+        return game, game.history_since(since, limit)
+
+    def make_move(self, game_id, letter):
+        """Makes a move.
+        Args:
+            game_id: The id of the game.
+            letter: The letter guessed by the player.
+        Returns:
+            A tuple of the game record and the message for the player.
+        Raises:
+            NotFoundError: If the game does not exist.
+            BadRequestError: If the move is not a single alphabet character.
+            ConflictError: If another move changed the game first.
+        """
+        game, results = self.make_moves(game_id, [letter])
+        if not results:
+            return game, 'Game is over!'
+        return game, results[0][1]
+
+    def make_moves(self, game_id, letters):
+        """Makes a batch of moves in order, stopping when the game is over,
+        and stores the game once.
+        Args:
+            game_id: The id of the game.
+            letters: The letters guessed by the player, in order.
+        Returns:
+            A tuple of the game record and a list of (letter, message) for
+            each move that was applied.
+        Raises:
+            NotFoundError: If the game does not exist.
+            BadRequestError: If any move is not a single alphabet character.
+            ConflictError: If another move changed the game first.
+        """
+        return self._on_stored_game(game_id, self._make_moves, letters)
+
+    def _make_moves(self, game, letters):
+        if game.game_over:
+            return game, []
+        for letter in letters:
+            if not rules.is_valid_move(letter):
+                raise BadRequestError('You must enter a single alphanumeric character!')
+
+        attempts_remaining = game.attempts_remaining
+        score = None
+        changed = False
+        results = []
+        for letter in letters:
+            result = rules.apply_move(game, letter)
+            if result == rules.GUESS_REPEAT:
+                results.append((letter, 'You already got the letter {}'.format(letter)))
+                continue
+            changed = True
+            if result in (rules.GUESS_WIN, rules.GUESS_LOSE):
+                won = result == rules.GUESS_WIN
+                attempts_used = rules.end_game(game, won)
+                score = ScoreRecord(game.user_name, date.today(), won,
+                                    attempts_used, game.attempts)
+            results.append((letter, rules.move_message(
+                    result, game.attempts_remaining,
+                    rules.reveal(game.answer, game.revealed))))
+            if game.game_over:
+                break
+
+        if changed:
+            self.repository.save_move(game, attempts_remaining, score)
+        return game, results
+
+    def cancel_game(self, game_id):
+        """Deletes a game in progress.
+        Raises:
+            NotFoundError: If the game does not exist.
+            ForbiddenError: If the game is already over.
+            ConflictError: If another move changed the game first.
+        """
+        self._on_stored_game(game_id, self._cancel_game)
+
+    def _cancel_game(self, game):
+        if game.game_over:
+            raise ForbiddenError('Illegal Action: Game is already over.')
+        self.repository.delete_game(game)
+
+    def _on_stored_game(self, game_id, function, *args):
+        """Calls function with a game, read through the repository's cache,
+        and the args. The copy may be a little old, which the repository
+        detects when the function writes it back, so then the function is
+        called once more with the stored game.
+        Returns:
+            The result of function.
+        Raises:
+            NotFoundError: If the game does not exist.
+            ConflictError: If the game also changed before the second write.
+        """
+        try:
+            return function(self.get_game(game_id), *args)
+        except ConflictError:
+            return function(self.get_game(game_id, cached=False), *args)
+
+    def get_user_games(self, user_name):
+        """Returns the active games of a player.
+        Raises:
+            NotFoundError: If the player does not exist.
+        """
+        if not self.repository.get_player(user_name):
+            raise NotFoundError('The user {} does not exist!.'.format(user_name))
+        return self.repository.player_games(user_name)
+
+    def get_user_scores(self, user_name):
+        """Returns the scores of a player.
+        Raises:
+            NotFoundError: If the player does not exist.
+        """
+        if not self.repository.get_player(user_name):
+            raise NotFoundError('A user with that name does not exist!')
+        return self.repository.player_scores(user_name)
+
+    def get_high_scores(self, number_of_results=10):
+        """Returns the best winning scores, best first.
+        Raises:
+            BadRequestError: If number_of_results is not over 0.
+            NotFoundError: If there are no winning scores.
+        """
+        if number_of_results <= 0:
+            raise BadRequestError('Number of results must be greater than 0!')
+        scores = self.repository.high_scores(number_of_results)
+        if not scores:
+            raise NotFoundError('No scores found for any users!')
+        return scores
+
+    def get_user_rankings(self, number_of_results=None):
+        """Returns the players with wins, best win ratio first.
+        Raises:
+            NotFoundError: If no player has won a game.
+        """
+        players = self.repository.player_rankings(number_of_results)
+        if not players:
+            raise NotFoundError('Cannot find any users!')
+        return players
+
+    def get_average_attempts(self):
+        """Returns the average attempts remaining of the active games, or None
+        if there are none."""
+        games, attempts_remaining = self.repository.active_game_totals()
+        if games <= 0:
+            return None
+        return attempts_remaining / float(games)
@@ -0,0 +1,23 @@
+"""errors.py - This file contains the exceptions raised by HangmanEngine.
+They mirror the endpoints exceptions that HangmanApi raises for the same
+conditions."""
+
+
+class EngineError(Exception):
+    """Base class of the engine's exceptions."""
+
+
+class BadRequestError(EngineError):
+    """The request is invalid."""
+
+
+class NotFoundError(EngineError):
+    """The user or game does not exist."""
+
+
+class ConflictError(EngineError):
+    """The user already exists, or the game changed since it was read."""
+
+
+class ForbiddenError(EngineError):
+    """The action is not allowed in the game's state."""
@@ -0,0 +1,92 @@
+"""memory.py - This file contains a Repository kept in process memory, for
+profiling and load-testing the engine without any storage cost. Records are
+held by reference, so nothing is copied or serialized."""
+
+import bisect
+import collections
+import itertools
+
+from engine import rules
+from engine.errors import ConflictError
+from engine.repository import Repository
+from engine.state import GameState
+
+
+class MemoryRepository(Repository):
+    """Repository kept in process memory."""
+
+    def __init__(self):
+        self._players = {}
+        self._emails = {}
+        self._games = {}
+        self._active_games = collections.defaultdict(set)
+        self._scores = collections.defaultdict(list)
+        # (rank, sequence, score) of the winning scores, best first.
+        self._wins = []
+        self._ids = itertools.count(1)
+        self._active_count = 0
+        self._active_attempts = 0
+
+    def get_player(self, name):
+        return self._players.get(name)
+
+    def add_player(self, player):
+        if player.name in self._players:
+            raise ConflictError('A User with username {} already exists!'.format(
+                    player.name))
+        if player.email in self._emails:
+            raise ConflictError('A User with email {} already exists!'.format(
+                    player.email))
+        self._players[player.name] = player
+        self._emails[player.email] = player
+
+    def build_game(self, user_name):
+        return GameState(user_name)
+
+    def add_game(self, game):
+        game.id = next(self._ids)
+        self._games[game.id] = game
+        self._active_games[game.user_name].add(game.id)
+        self._active_count += 1
+        self._active_attempts += game.attempts_remaining
+
+    def get_game(self, game_id, cached=True):
+        return self._games.get(game_id)
+
+    def save_move(self, game, attempts_remaining, score=None):
+        self._games[game.id] = game
+        self._active_attempts -= attempts_remaining
+        if game.game_over:
+            self._active_games[game.user_name].discard(game.id)
+            self._active_count -= 1
+        else:
+            self._active_attempts += game.attempts_remaining
+        if score:
+            rules.add_result(self._players[score.user_name], score.won)
+            self._scores[score.user_name].append(score)
+            if score.won:
+                rank = rules.score_rank(score.attempts_used, score.attempts)
+                bisect.insort(self._wins, (rank, next(self._ids), score))
+
+    def delete_game(self, game):
+        del self._games[game.id]
+        self._active_games[game.user_name].discard(game.id)
+        self._active_count -= 1
+        self._active_attempts -= game.attempts_remaining
+
+    def player_games(self, name):
+        return [self._games[game_id] for game_id in sorted(self._active_games[name])]
+
+    def player_scores(self, name):
+        return list(self._scores[name])
+
+    def high_scores(self, limit):
+        return [score for _, _, score in self._wins[:limit]]
+
+    def player_rankings(self, limit):
+        players = sorted((player for player in self._players.itervalues()
+                          if player.win_ratio > 0), key=rules.player_rank)
+        return players[:limit]
+
+    def active_game_totals(self):
+        return self._active_count, self._active_attempts
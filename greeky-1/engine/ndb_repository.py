@@ -0,0 +1,108 @@
+"""ndb_repository.py - This file contains the Repository over the App Engine
+datastore models, which HangmanApi runs HangmanEngine on. Its game records
+are the Game entities themselves, read through the entity cache, so the
+engine keeps their paged history, and its players are the Users. Game ids are
+urlsafe Game keys and users are keyed by name. The repository keeps no
+state, so one instance serves every request."""
+
+from datetime import datetime
+
+from google.appengine.ext import ndb
+
+from engine.errors import ConflictError
+from engine.repository import Repository
+from engine.state import ScoreRecord
+from models.aggregate import ActiveGamesShard
+from models.game import Game, StaleGameError
+from models.leaderboard import Leaderboard, LEADERBOARD_SIZE
+from models.score import Score
+from models.user import UniqueConstraintError, User
+from utils import get_by_urlsafe
+
+
+class NdbRepository(Repository):
+    """Repository over the datastore models. Writes go through the model
+    methods, which also keep the running totals of active games, the user
+    counters and the leaderboard."""
+
+    def get_player(self, name):
+        return User.get_by_name(name)
+
+    def add_player(self, player):
+        # The user is created along with the markers that claim its name and
+        # email, in one transaction, failing if either is taken.
+        try:
+            User.create(player.name, player.email)
+        except UniqueConstraintError, e:
+            raise ConflictError(e.args[0])
+
+    def build_game(self, user_name):
+        return Game(user=ndb.Key(User, user_name), moves=[])
+
+    def add_game(self, game):
+        # The game and the running totals are written concurrently.
+        futures = [game.put_async(),
+                   ActiveGamesShard.add_async(1, game.attempts_remaining)]
+        for future in futures:
+            future.get_result()
+
+    def get_game(self, game_id, cached=True):
+        game = get_by_urlsafe(game_id, Game, cached)
+        # Games created before the letter index existed are indexed lazily.
+        if game and game.letter_positions is None:
+            game.build_index()
+        return game
+
+    def save_move(self, game, attempts_remaining, score=None):
+        if score:
+            score = Score(user=game.user, date=score.date, won=score.won,
+                          attempts_used=score.attempts_used, attempts=score.attempts)
+        try:
+            game.save_move(score)
+        except StaleGameError, e:
+            raise ConflictError('{} Get the game and try again.'.format(e.args[0]))
+        if game.game_over:
+            ActiveGamesShard.add(-1, -attempts_remaining)
+        elif game.attempts_remaining != attempts_remaining:
+            ActiveGamesShard.add(0, game.attempts_remaining - attempts_remaining)
+
+    def delete_game(self, game):
+        try:
+            game.cancel()
+        except StaleGameError, e:
+            raise ConflictError('{} Get the game and try again.'.format(e.args[0]))
+        ActiveGamesShard.add(-1, -game.attempts_remaining)
+
+    def player_games(self, name):
+        return Game.query(Game.user == ndb.Key(User, name),
+                          Game.game_over == False).fetch()
+
+    def player_scores(self, name):
+        return [self._score(score, name)
+                for score in Score.query(Score.user == ndb.Key(User, name))]
+
+    def high_scores(self, limit):
+        # Served from the materialized leaderboard when it is deep enough.
+        if limit is not None and limit <= LEADERBOARD_SIZE:
+            return [ScoreRecord(entry['user_name'],
+                                datetime.strptime(entry['date'], '%Y-%m-%d').date(),
+                                True, entry['attempts_used'], entry['attempts'])
+                    for entry in Leaderboard.top()[:limit]]
+        scores = Score.query(Score.won == True) \
+            .order(Score.attempts_used, -Score.attempts) \
+            .fetch(limit=limit)
+        names = User.names_by_key([score.user for score in scores])
+        return [self._score(score, names[score.user]) for score in scores]
+
+    def player_rankings(self, limit):
+        return User.query(User.win_ratio > 0.0) \
+            .order(-User.win_ratio, User.total_played) \
+            .fetch(limit=limit)
+
+    def active_game_totals(self):
+        return ActiveGamesShard.totals()
+
+    @staticmethod
+    def _score(score, user_name):
+        return ScoreRecord(user_name, score.date, score.won, score.attempts_used,
+                           score.attempts)
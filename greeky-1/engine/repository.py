@@ -0,0 +1,83 @@
+"""repository.py - This file contains the storage interface of HangmanEngine.
+Implementations: engine.memory, engine.sqlite and engine.ndb_repository."""
+
+
+class Repository(object):
+    """Loads and stores the game, player and ScoreRecord records of
+    HangmanEngine. Game records are GameStates, or any object with their
+    attributes and methods, such as the Game entities of the datastore.
+    Games are identified by opaque ids that the repository assigns in
+    add_game. Finished games are counted on their player by the repository,
+    in save_move."""
+
+    def get_player(self, name):
+        """Returns the player with a name, or None."""
+        raise NotImplementedError
+
+    def add_player(self, player):
+        """Stores a new PlayerState.
+        Raises:
+            ConflictError: If the player's name or email is taken.
+        """
+        raise NotImplementedError
+
+    def build_game(self, user_name):
+        """Returns a new, unsaved game record of a player, for
+        rules.start_game to initialize."""
+        raise NotImplementedError
+
+    def add_game(self, game):
+        """Stores a new game record and assigns its id."""
+        raise NotImplementedError
+
+    def get_game(self, game_id, cached=True):
+        """Returns the game record with an id, or None.
+        Args:
+            game_id: The id of the game.
+            cached: False to bypass any cache of the repository, whose
+                copies may be older than the stored game.
+        """
+        raise NotImplementedError
+
+    def save_move(self, game, attempts_remaining, score=None):
+        """Atomically stores a played game record and, when the game ended,
+        its new ScoreRecord, counting the game on its player.
+        Args:
+            game: The played game record.
+            attempts_remaining: The game's attempts remaining when it was
+                loaded.
+            score: The game's ScoreRecord if it ended, else None.
+        Raises:
+            ConflictError: If the game was changed since it was loaded.
+        """
+        raise NotImplementedError
+
+    def delete_game(self, game):
+        """Deletes a game record.
+        Raises:
+            ConflictError: If the game was changed since it was loaded.
+        """
+        raise NotImplementedError
+
+    def player_games(self, name):
+        """Returns the active game records of a player."""
+        raise NotImplementedError
+
+    def player_scores(self, name):
+        """Returns the ScoreRecords of a player."""
+        raise NotImplementedError
+
+    def high_scores(self, limit):
+        """Returns up to limit winning ScoreRecords ordered by
+        rules.score_rank."""
+        raise NotImplementedError
+
+    def player_rankings(self, limit):
+        """Returns up to limit players with a win ratio over 0, ordered by
+        rules.player_rank."""
+        raise NotImplementedError
+
+    def active_game_totals(self):
+        """Returns the number of active games and the total of their
+        attempts remaining."""
+        raise NotImplementedError
@@ -0,0 +1,222 @@
+"""rules.py - This file contains the rules of Hangman, free of any storage.
+They operate on any game object with the attributes of models.game.Game
+(answer, attempts, attempts_remaining, game_over, letter_positions, revealed,
+letters_remaining and a history() method returning the mutable move list)
+and any player object with the won, total_played and win_ratio of
+models.user.User."""
+
+import struct
+
+# Results of resolving a guess against a game's letter index.
+GUESS_MISS = 0
+GUESS_HIT = 1
+GUESS_REPEAT = 2
+GUESS_WIN = 3
+# Recorded in the move history for the miss that ends a game.
+GUESS_LOSE = 4
+
+DEFAULT_ATTEMPTS = 6
+# The largest attempts and letter code point a move record can hold.
+MAX_ATTEMPTS = 0xFFFF
+MAX_LETTER = 0xFFFF
+
+# A move history record: letter code point, result and attempts remaining.
+MOVE_RECORD = struct.Struct('<HBH')
+
+
+def start_game(game, answer, attempts):
+    """Initializes the state of a new game.
+    Args:
+       game: The game object to initialize.
+       answer: The answer for the game.
+       attempts: The maximum number of attempts allowed, DEFAULT_ATTEMPTS
+           when None.
+    Raises:
+       ValueError: If attempts is not between 1 and MAX_ATTEMPTS.
+    """
+    if attempts is None:
+        attempts = DEFAULT_ATTEMPTS
+    elif not 0 < attempts <= MAX_ATTEMPTS:
+        raise ValueError('Attempts has to be between 1 and {}.'.format(MAX_ATTEMPTS))
+    game.answer = answer
+    game.attempts = attempts
+    game.attempts_remaining = attempts
+    game.game_over = False
+    index_answer(game)
+
+
+def index_answer(game, user_answer=None):
+    """Builds the letter to positions index, the revealed bitmask and the
+    count of letters still hidden of a game.
+    Args:
+       game: The game object to index.
+       user_answer: The letters already revealed, as a list with blanks for
+           hidden positions, or None if nothing is revealed.
+    """
+    positions = {}
+    revealed = 0
+    for i, letter in enumerate(game.answer):
+        positions[letter] = positions.get(letter, 0) | (1 << i)
+        if user_answer and user_answer[i] == letter:
+            revealed |= 1 << i
+    game.letter_positions = positions
+    game.revealed = revealed
+    game.letters_remaining = len(game.answer) - bin(revealed).count('1')
+
+
+def reveal(answer, revealed):
+    """Returns the answer as a list of letters, blank where the revealed
+    bitmask is not set."""
+    return [letter if revealed >> i & 1 else u''
+            for i, letter in enumerate(answer)]
+
+
+def guess(game, letter):
+    """Resolves a guessed letter against an indexed game and reveals it when
+    it is a new hit.
+    Args:
+       game: The game object being played.
+       letter: The letter guessed by the player.
+    Returns:
+       GUESS_MISS, GUESS_REPEAT, GUESS_HIT or GUESS_WIN.
+    """
+    mask = game.letter_positions.get(letter)
+    if not mask:
+        return GUESS_MISS
+    if game.revealed & mask:
+        return GUESS_REPEAT
+    game.revealed |= mask
+    game.letters_remaining -= bin(mask).count('1')
+    if game.letters_remaining == 0:
+        return GUESS_WIN
+    return GUESS_HIT
+
+
+def is_valid_move(move):
+    """Returns True if a move is a single alphabet character that fits in a
+    move record."""
+    return (bool(move) and move.isalpha() and len(list(move)) == 1
+            and ord(move) <= MAX_LETTER)
+
+
+def apply_move(game, letter):
+    """Applies a valid guess to an indexed game: reveals a hit, spends an
+    attempt on a miss and records the move. Repeats change nothing.
+    The caller ends the game on GUESS_WIN and GUESS_LOSE.
+    Args:
+       game: The game object being played.
+       letter: The letter guessed by the player.
+    Returns:
+       GUESS_MISS, GUESS_REPEAT, GUESS_HIT, GUESS_WIN or GUESS_LOSE.
+    """
+    result = guess(game, letter)
+    if result == GUESS_REPEAT:
+        return result
+    if result == GUESS_MISS:
+        game.attempts_remaining -= 1
+        if game.attempts_remaining == 0:
+            result = GUESS_LOSE
+    game.history().append((letter, result, game.attempts_remaining))
+    return result
+
+
+def end_game(game, won):
+    """Marks a game over.
+    Args:
+       game: The game object that ended.
+       won: Indicates whether the player wins or loses.
+    Returns:
+       int: The attempts used in the game.
+    """
+    game.game_over = True
+    return game.attempts - game.attempts_remaining
+
+
+def add_result(player, won):
+    """Counts a finished game on a player object that keeps its own
+    counters. The datastore keeps them on UserCounterShards instead.
+    Args:
+       player: The player object of the game.
+       won: Indicates whether the player won the game.
+    """
+    if won:
+        player.won += 1
+    player.total_played += 1
+    player.win_ratio = win_ratio(player.won, player.total_played)
+
+
+def win_ratio(won, total_played):
+    """Returns the share of games won, rounded to two decimals, or 0.0 for a
+    player who has not finished a game."""
+    if not total_played:
+        return 0.0
+    return float("{0:.2f}".format(won / float(total_played)))
+
+
+def move_message(result, attempts_remaining, user_answer):
+    """Returns the message shown to the player for a move.
+    Args:
+       result: The GUESS_* result of the move.
+       attempts_remaining: The attempts remaining after the move.
+       user_answer: The revealed answer after the move.
+    Returns:
+       str: The message for the move.
+    """
+    if result == GUESS_MISS:
+        return 'Wrong! You have {} attempts remaining!'.format(attempts_remaining)
+    if result == GUESS_LOSE:
+        return 'Game Over, You lose!'
+    if result == GUESS_WIN:
+        return 'You win!'
+    return 'Correct! You got {}'.format(user_answer)
+
+
+def score_rank(attempts_used, attempts):
+    """Returns the sort key of a winning score: fewer attempts used ranks
+    higher, and ties go to the game with more attempts allowed."""
+    return attempts_used, -attempts
+
+
+def player_rank(player):
+    """Returns the sort key of a player in the rankings: a higher win ratio
+    ranks higher, and ties go to the player with fewer games played."""
+    return -player.win_ratio, player.total_played
+
+
+def replay_moves(game, moves, revealed, first_number, since, stop):
+    """Rebuilds the result message of each of a run of recorded moves.
+    Args:
+       game: The indexed game the moves belong to.
+       moves: The (letter, result, attempts_remaining) records of the run.
+       revealed: Bitmask of the positions revealed before the first move.
+       first_number: The number of the first move in the game's history.
+       since: The number of the first move wanted.
+       stop: The number after the last move wanted.
+    Returns:
+       A list of (number, letter, message, attempts_remaining) records.
+    """
+    records = []
+    for number, (letter, result, attempts_remaining) in enumerate(moves, first_number):
+        if number >= stop:
+            break
+        revealed |= game.letter_positions.get(letter, 0)
+        if number >= since:
+            records.append((number, letter, move_message(
+                    result, attempts_remaining, reveal(game.answer, revealed)),
+                    attempts_remaining))
+    return records
+
+
+def pack_moves(moves):
+    """Packs (letter, result, attempts_remaining) records into a string."""
+    return ''.join(MOVE_RECORD.pack(ord(letter), result, attempts_remaining)
+                   for letter, result, attempts_remaining in moves)
+
+
+def unpack_moves(data):
+    """Unpacks a string of move records packed by pack_moves."""
+    moves = []
+    for offset in xrange(0, len(data), MOVE_RECORD.size):
+        letter, result, attempts_remaining = MOVE_RECORD.unpack_from(data, offset)
+        moves.append((unichr(letter), result, attempts_remaining))
+    return moves
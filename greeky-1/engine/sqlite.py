@@ -0,0 +1,179 @@
+"""sqlite.py - This file contains a Repository stored in SQLite, for profiling
+the engine against a real, indexed store on a single machine. Games keep the
+compact layout of the datastore: the answer as text, the revealed letters as
+a bitmask and the history as packed move records."""
+
+from __future__ import absolute_import
+
+from datetime import datetime
+import json
+import sqlite3
+
+from engine import rules
+from engine.errors import ConflictError
+from engine.repository import Repository
+from engine.state import GameState, PlayerState, ScoreRecord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY,
+    email TEXT UNIQUE,
+    won INTEGER NOT NULL,
+    total_played INTEGER NOT NULL,
+    win_ratio REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS players_ranking
+    ON players (win_ratio DESC, total_played);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    user_name TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    attempts_remaining INTEGER NOT NULL,
+    game_over INTEGER NOT NULL,
+    letter_positions TEXT NOT NULL,
+    -- Text, as the bitmask of a long answer overflows an INTEGER.
+    revealed TEXT NOT NULL,
+    letters_remaining INTEGER NOT NULL,
+    moves BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS games_active ON games (game_over, user_name);
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    user_name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    won INTEGER NOT NULL,
+    attempts_used INTEGER NOT NULL,
+    attempts INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS scores_user ON scores (user_name);
+CREATE INDEX IF NOT EXISTS scores_high
+    ON scores (won, attempts_used, attempts DESC);
+"""
+
+_GAME_COLUMNS = ('id, user_name, answer, attempts, attempts_remaining, game_over, '
+                 'letter_positions, revealed, letters_remaining, moves')
+
+
+class SqliteRepository(Repository):
+    """Repository stored in a SQLite database."""
+
+    def __init__(self, path=':memory:'):
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def get_player(self, name):
+        row = self._connection.execute(
+                'SELECT name, email, won, total_played, win_ratio FROM players '
+                'WHERE name = ?', (name,)).fetchone()
+        return PlayerState(*row) if row else None
+
+    def add_player(self, player):
+        with self._connection:
+            for column, label, value in (('name', 'username', player.name),
+                                         ('email', 'email', player.email)):
+                if self._connection.execute(
+                        'SELECT 1 FROM players WHERE {} = ?'.format(column),
+                        (value,)).fetchone():
+                    raise ConflictError('A User with {} {} already exists!'.format(
+                            label, value))
+            self._connection.execute(
+                    'INSERT INTO players VALUES (?, ?, ?, ?, ?)',
+                    (player.name, player.email, player.won, player.total_played,
+                     player.win_ratio))
+
+    def build_game(self, user_name):
+        return GameState(user_name)
+
+    def add_game(self, game):
+        with self._connection:
+            cursor = self._connection.execute(
+                    'INSERT INTO games VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    self._game_values(game))
+        game.id = cursor.lastrowid
+
+    def get_game(self, game_id, cached=True):
+        row = self._connection.execute(
+                'SELECT {} FROM games WHERE id = ?'.format(_GAME_COLUMNS),
+                (game_id,)).fetchone()
+        return self._game(row) if row else None
+
+    def save_move(self, game, attempts_remaining, score=None):
+        with self._connection:
+            self._connection.execute(
+                    'UPDATE games SET user_name = ?, answer = ?, attempts = ?, '
+                    'attempts_remaining = ?, game_over = ?, letter_positions = ?, '
+                    'revealed = ?, letters_remaining = ?, moves = ? WHERE id = ?',
+                    self._game_values(game) + (game.id,))
+            if score:
+                player = self.get_player(score.user_name)
+                rules.add_result(player, score.won)
+                self._connection.execute(
+                        'UPDATE players SET won = ?, total_played = ?, win_ratio = ? '
+                        'WHERE name = ?',
+                        (player.won, player.total_played, player.win_ratio,
+                         player.name))
+                self._connection.execute(
+                        'INSERT INTO scores VALUES (NULL, ?, ?, ?, ?, ?)',
+                        (score.user_name, score.date.isoformat(), score.won,
+                         score.attempts_used, score.attempts))
+
+    def delete_game(self, game):
+        with self._connection:
+            self._connection.execute('DELETE FROM games WHERE id = ?', (game.id,))
+
+    def player_games(self, name):
+        rows = self._connection.execute(
+                'SELECT {} FROM games WHERE game_over = 0 AND user_name = ? '
+                'ORDER BY id'.format(_GAME_COLUMNS), (name,))
+        return [self._game(row) for row in rows]
+
+    def player_scores(self, name):
+        rows = self._connection.execute(
+                'SELECT user_name, date, won, attempts_used, attempts FROM scores '
+                'WHERE user_name = ?', (name,))
+        return [self._score(row) for row in rows]
+
+    def high_scores(self, limit):
+        rows = self._connection.execute(
+                'SELECT user_name, date, won, attempts_used, attempts FROM scores '
+                'WHERE won = 1 ORDER BY attempts_used, attempts DESC, id LIMIT ?',
+                (-1 if limit is None else limit,))
+        return [self._score(row) for row in rows]
+
+    def player_rankings(self, limit):
+        rows = self._connection.execute(
+                'SELECT name, email, won, total_played, win_ratio FROM players '
+                'WHERE win_ratio > 0 ORDER BY win_ratio DESC, total_played LIMIT ?',
+                (-1 if limit is None else limit,))
+        return [PlayerState(*row) for row in rows]
+
+    def active_game_totals(self):
+        games, attempts_remaining = self._connection.execute(
+                'SELECT COUNT(*), TOTAL(attempts_remaining) FROM games '
+                'WHERE game_over = 0').fetchone()
+        return games, int(attempts_remaining)
+
+    @staticmethod
+    def _game_values(game):
+        return (game.user_name, game.answer, game.attempts, game.attempts_remaining,
+                game.game_over, json.dumps(game.letter_positions), str(game.revealed),
+                game.letters_remaining, sqlite3.Binary(rules.pack_moves(game.moves)))
+
+    @staticmethod
+    def _game(row):
+        game = GameState(row[1], row[0])
+        game.answer = row[2]
+        game.attempts = row[3]
+        game.attempts_remaining = row[4]
+        game.game_over = bool(row[5])
+        game.letter_positions = json.loads(row[6])
+        game.revealed = int(row[7])
+        game.letters_remaining = row[8]
+        game.moves = rules.unpack_moves(str(row[9]))
+        return game
+
+    @staticmethod
+    def _score(row):
+        return ScoreRecord(row[0], datetime.strptime(row[1], '%Y-%m-%d').date(),
+                           bool(row[2]), row[3], row[4])
@@ -0,0 +1,66 @@
+"""state.py - This file contains the plain records that repositories load
+and store for HangmanEngine. GameState and PlayerState provide the attributes
+that engine.rules operates on, and GameState the history methods that
+HangmanEngine reads, as models.game.Game does for the datastore."""
+
+from engine import rules
+
+
+class GameState(object):
+    """A game, identified by the id its repository assigned when it was
+    added."""
+
+    def __init__(self, user_name, game_id=None):
+        self.id = game_id
+        self.user_name = user_name
+        self.answer = None
+        self.attempts = None
+        self.attempts_remaining = None
+        self.game_over = False
+        self.letter_positions = None
+        self.revealed = 0
+        self.letters_remaining = None
+        self.moves = []
+
+    def history(self):
+        """Returns the mutable list of (letter, result, attempts_remaining)
+        move records."""
+        return self.moves
+
+    @property
+    def move_count(self):
+        """The number of moves in the whole history."""
+        return len(self.moves)
+
+    def history_since(self, since, limit):
+        """Returns a slice of the move history.
+        Args:
+            since: The number of the first move wanted, counting from 0.
+            limit: The maximum number of moves wanted.
+        Returns:
+            A list of (number, letter, message, attempts_remaining) records.
+        """
+        return rules.replay_moves(self, self.moves, 0, 0, since,
+                                  min(since + limit, len(self.moves)))
+
+
+class PlayerState(object):
+    """A player and their win counters."""
+
+    def __init__(self, name, email, won=0, total_played=0, win_ratio=0.0):
+        self.name = name
+        self.email = email
+        self.won = won
+        self.total_played = total_played
+        self.win_ratio = win_ratio
+
+
+class ScoreRecord(object):
+    """The result of a finished game."""
+
+    def __init__(self, user_name, date, won, attempts_used, attempts):
+        self.user_name = user_name
+        self.date = date
+        self.won = won
+        self.attempts_used = attempts_used
+        self.attempts = attempts
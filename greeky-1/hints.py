@@ -0,0 +1,119 @@
+"""hints.py - This file contains the hint solver over the word bank. For each
+word length it keeps a word x position matrix of letter codes and a word x
+letter presence matrix, so the candidates matching a game's revealed pattern
+and guesses are filtered with vectorized NumPy operations instead of a loop
+over the words. Candidate sets are cached per pattern."""
+
+import threading
+
+import numpy
+
+import cache
+import wordbank
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+CANDIDATE_CACHE_SIZE = 1000
+# The word bank only changes with a deploy, so cached candidates stay valid.
+CANDIDATE_CACHE_TTL = 24 * 3600
+
+_solver = []
+_solver_lock = threading.Lock()
+
+
+class Solver(object):
+    """Suggests the most informative next letter of a game."""
+
+    def __init__(self, bank):
+        """Builds the matrices of a word bank.
+        Args:
+            bank: The wordbank.WordBank to solve over.
+        """
+        # length -> (codes, presence)
+        self._matrices = {}
+        for length in bank.lengths():
+            packed = bank.packed(length)
+            codes = numpy.frombuffer(packed, dtype=numpy.uint8).reshape(
+                    len(packed) // length, length) - ord('a')
+            presence = numpy.zeros((len(codes), len(ALPHABET)), dtype=bool)
+            presence[numpy.arange(len(codes))[:, numpy.newaxis], codes] = True
+            self._matrices[length] = (codes, presence)
+        self._candidates = cache.LRUCache(CANDIDATE_CACHE_SIZE, CANDIDATE_CACHE_TTL)
+
+    def candidates(self, pattern, guessed):
+        """Returns the indexes of the words of the pattern's length that match
+        it, as an array.
+        Args:
+            pattern: The answer as a list of letters, blank where not yet
+                revealed.
+            guessed: The letters guessed so far, hits and misses.
+        """
+        key = (u''.join(letter or u'_' for letter in pattern),
+               u''.join(sorted(set(guessed))))
+        indexes = self._candidates.get(key)
+        if indexes is None:
+            indexes = self._filter(pattern, guessed)
+            self._candidates.set(key, indexes)
+        return indexes
+
+    def _filter(self, pattern, guessed):
+        matrices = self._matrices.get(len(pattern))
+        letters = [letter for letter in pattern if letter] + list(guessed)
+        if matrices is None or any(letter not in ALPHABET for letter in letters):
+            return numpy.zeros(0, dtype=numpy.intp)
+        codes, _ = matrices
+
+        mask = numpy.ones(len(codes), dtype=bool)
+        hidden = []
+        for i, letter in enumerate(pattern):
+            if letter:
+                mask &= codes[:, i] == ALPHABET.index(letter)
+            else:
+                hidden.append(i)
+        # A guessed letter is revealed at every position holding it, so no
+        # hidden position can hold one.
+        if hidden and guessed:
+            is_guessed = numpy.zeros(len(ALPHABET), dtype=bool)
+            is_guessed[[ALPHABET.index(letter) for letter in guessed]] = True
+            mask &= ~is_guessed[codes[:, hidden]].any(axis=1)
+        return numpy.flatnonzero(mask)
+
+    def hint(self, pattern, guessed):
+        """Returns the unguessed letter whose guess tells the most about the
+        answer, and the number of candidate words.
+        Args:
+            pattern: The answer as a list of letters, blank where not yet
+                revealed.
+            guessed: The letters guessed so far, hits and misses.
+        Returns:
+            A tuple of the letter, or None if no word matches, and the number
+            of candidate words.
+        """
+        indexes = self.candidates(pattern, guessed)
+        if not len(indexes):
+            return None, 0
+        _, presence = self._matrices[len(pattern)]
+        counts = presence[indexes].sum(axis=0)
+        for letter in guessed:
+            counts[ALPHABET.index(letter)] = 0
+
+        # The entropy of the hit or miss outcome of each letter, preferring
+        # the most likely hit among equally informative letters.
+        p = counts / float(len(indexes))
+        entropy = numpy.zeros(len(ALPHABET))
+        split = (p > 0) & (p < 1)
+        entropy[split] = -(p[split] * numpy.log2(p[split]) +
+                           (1 - p[split]) * numpy.log2(1 - p[split]))
+        best = numpy.lexsort((counts, entropy))[-1]
+        if not counts[best]:
+            return None, len(indexes)
+        return ALPHABET[best], len(indexes)
+
+
+def get():
+    """Returns the solver over the application's word bank, building it on
+    first use."""
+    if not _solver:
+        with _solver_lock:
+            if not _solver:
+                _solver.append(Solver(wordbank.get()))
+    return _solver[0]
@@ -0,0 +1,263 @@
+"""instrumentation.py - This file contains the per-request instrumentation of
+the API: wall time, App Engine RPCs by service and call, entity bytes read and
+written and entity cache hits of each endpoint call.
+
+Each instance aggregates its requests locally and flushes the deltas to
+memcache counters every FLUSH_INTERVAL seconds, so snapshot() returns the
+totals over all instances. Requests slower than SLOW_REQUEST_MS are logged
+with their RPC trace."""
+
+import collections
+import functools
+import logging
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+SLOW_REQUEST_MS = 1000
+FLUSH_INTERVAL = 10
+MEMCACHE_PREFIX = 'metrics:'
+
+# Upper bounds in milliseconds of the latency histogram buckets. The last
+# bucket counts everything slower.
+LATENCY_BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# The RPCs aggregated across instances. Others are still counted in the
+# trace of a slow request.
+TRACKED_RPCS = (
+    'datastore_v3.Get', 'datastore_v3.Put', 'datastore_v3.Delete',
+    'datastore_v3.RunQuery', 'datastore_v3.Next', 'datastore_v3.AllocateIds',
+    'datastore_v3.BeginTransaction', 'datastore_v3.Commit',
+    'datastore_v3.Rollback', 'memcache.Get', 'memcache.Set', 'memcache.Delete',
+    'memcache.Increment', 'memcache.BatchIncrement', 'taskqueue.Add',
+    'taskqueue.BulkAdd', 'mail.Send',
+)
+CACHE_EVENTS = ('local_hits', 'local_misses', 'memcache_hits', 'memcache_misses')
+# The steps of an instance warmup, see warmup.py.
+STARTUP_STEPS = ('import_api', 'leaderboard', 'average_attempts', 'word_bank', 'total')
+STARTUP = 'startup'
+
+# Datastore calls whose response carries entities read, and whose request
+# carries entities written.
+_READ_CALLS = frozenset(['Get', 'RunQuery', 'Next'])
+_WRITE_CALLS = frozenset(['Put'])
+
+_endpoints = []
+_totals = collections.Counter()
+_totals_lock = threading.Lock()
+_last_flush = [time.time()]
+_request = threading.local()
+_hooks_lock = threading.Lock()
+_hooks_installed = []
+
+
+class RequestStats(object):
+    """The measurements of one endpoint call."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.time()
+        self.rpcs = collections.Counter()
+        self.cache = collections.Counter()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        # (service.call, start offset ms, duration ms) of each RPC.
+        self.trace = []
+        self.pending = {}
+
+
+def instrumented(method):
+    """Decorates an endpoint method to record its measurements. Apply it
+    below @endpoints.method."""
+    _endpoints.append(method.__name__)
+    install_hooks()
+
+    @functools.wraps(method)
+    def wrapper(service, request):
+        stats = RequestStats(method.__name__)
+        _request.stats = stats
+        error = True
+        try:
+            response = method(service, request)
+            error = False
+            return response
+        finally:
+            _request.stats = None
+            _finish(stats, error)
+    return wrapper
+
+
+def count_cache(event):
+    """Counts an entity cache event against the current request, if any."""
+    stats = getattr(_request, 'stats', None)
+    if stats is not None:
+        stats.cache[event] += 1
+
+
+def install_hooks():
+    """Installs the RPC hooks once per instance."""
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+                'instrumentation', _pre_call)
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+                'instrumentation', _post_call)
+        _hooks_installed.append(True)
+
+
+def _pre_call(service, call, request, response):
+    stats = getattr(_request, 'stats', None)
+    if stats is not None:
+        stats.pending[id(request)] = time.time()
+
+
+def _post_call(service, call, request, response):
+    stats = getattr(_request, 'stats', None)
+    if stats is None:
+        return
+    now = time.time()
+    start = stats.pending.pop(id(request), now)
+    name = '{}.{}'.format(service, call)
+    stats.rpcs[name] += 1
+    stats.trace.append((name, (start - stats.start) * 1000, (now - start) * 1000))
+    if service == 'datastore_v3':
+        if call in _READ_CALLS:
+            stats.bytes_read += response.ByteSize()
+        elif call in _WRITE_CALLS:
+            stats.bytes_written += request.ByteSize()
+
+
+def _finish(stats, error):
+    """Adds the measurements of a request to the instance totals, logs it if
+    it was slow and flushes the totals when they are due."""
+    elapsed_ms = (time.time() - stats.start) * 1000
+    prefix = stats.endpoint + ':'
+    deltas = collections.Counter({
+        prefix + 'calls': 1,
+        prefix + 'errors': int(error),
+        prefix + 'time_ms': int(elapsed_ms),
+        prefix + 'bucket:{}'.format(_bucket(elapsed_ms)): 1,
+        prefix + 'bytes_read': stats.bytes_read,
+        prefix + 'bytes_written': stats.bytes_written,
+    })
+    for name, count in stats.rpcs.iteritems():
+        if name in TRACKED_RPCS:
+            deltas[prefix + 'rpc:' + name] = count
+    for event, count in stats.cache.iteritems():
+        deltas[prefix + 'cache:' + event] = count
+
+    if elapsed_ms >= SLOW_REQUEST_MS:
+        logging.warning('Slow request %s: %dms, %d RPCs\n%s', stats.endpoint,
+                        elapsed_ms, sum(stats.rpcs.values()),
+                        '\n'.join('  +{:.0f}ms {} {:.0f}ms'.format(offset, name, ms)
+                                  for name, offset, ms in stats.trace))
+
+    with _totals_lock:
+        _totals.update(deltas)
+        if time.time() - _last_flush[0] < FLUSH_INTERVAL:
+            return
+        _last_flush[0] = time.time()
+        totals = dict((key, value) for key, value in _totals.iteritems() if value)
+        _totals.clear()
+    flush(totals)
+
+
+def flush(totals):
+    """Adds instance totals to the memcache counters shared by all the
+    instances."""
+    if totals:
+        memcache.offset_multi(totals, key_prefix=MEMCACHE_PREFIX, initial_value=0)
+
+
+def _bucket(elapsed_ms):
+    """Returns the index of the latency histogram bucket of a duration."""
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if elapsed_ms < bound:
+            return i
+    return len(LATENCY_BUCKETS)
+
+
+def record_startup(timings):
+    """Adds the durations of the steps of an instance warmup to the counters
+    shared by all the instances.
+    Args:
+        timings: The milliseconds taken by each of STARTUP_STEPS.
+    """
+    deltas = dict(('{}:{}_ms'.format(STARTUP, step), int(ms))
+                  for step, ms in timings.iteritems() if step in STARTUP_STEPS)
+    deltas[STARTUP + ':instances'] = 1
+    flush(deltas)
+
+
+def snapshot():
+    """Returns the totals of every instrumented endpoint, flushed from all
+    instances, as a JSON serializable dict keyed by endpoint name, and the
+    mean warmup step durations under 'startup'."""
+    fields = _fields()
+    keys = ['{}:{}'.format(endpoint, field) for endpoint in _endpoints
+            for field in fields] + _startup_keys()
+    values = memcache.get_multi(keys, key_prefix=MEMCACHE_PREFIX)
+    bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['inf']
+
+    result = {}
+    for endpoint in _endpoints:
+        counts = dict((field, int(values.get('{}:{}'.format(endpoint, field), 0)))
+                      for field in fields)
+        calls = counts['calls']
+        if not calls:
+            continue
+        hits = counts['cache:local_hits'] + counts['cache:memcache_hits']
+        lookups = hits + counts['cache:memcache_misses']
+        result[endpoint] = {
+            'calls': calls,
+            'errors': counts['errors'],
+            'mean_ms': counts['time_ms'] / float(calls),
+            'latency_histogram_ms': dict(
+                    (bound, counts['bucket:{}'.format(i)])
+                    for i, bound in enumerate(bounds) if counts['bucket:{}'.format(i)]),
+            'rpcs_per_call': dict(
+                    (name, counts['rpc:' + name] / float(calls))
+                    for name in TRACKED_RPCS if counts['rpc:' + name]),
+            'bytes_read_per_call': counts['bytes_read'] / float(calls),
+            'bytes_written_per_call': counts['bytes_written'] / float(calls),
+            'cache_hit_rate': hits / float(lookups) if lookups else None,
+        }
+
+    instances = int(values.get(STARTUP + ':instances', 0))
+    if instances:
+        result[STARTUP] = {
+            'instances': instances,
+            'mean_ms': dict(
+                    (step, int(values.get('{}:{}_ms'.format(STARTUP, step), 0)) /
+                     float(instances))
+                    for step in STARTUP_STEPS),
+        }
+    return result
+
+
+def reset():
+    """Clears the counters shared by all the instances."""
+    with _totals_lock:
+        _totals.clear()
+    memcache.delete_multi(['{}:{}'.format(endpoint, field)
+                           for endpoint in _endpoints for field in _fields()] +
+                          _startup_keys(),
+                          key_prefix=MEMCACHE_PREFIX)
+
+
+def _fields():
+    """Returns the names of the counters kept for each endpoint."""
+    fields = ['calls', 'errors', 'time_ms', 'bytes_read', 'bytes_written']
+    fields += ['bucket:{}'.format(i) for i in range(len(LATENCY_BUCKETS) + 1)]
+    fields += ['rpc:' + name for name in TRACKED_RPCS]
+    fields += ['cache:' + event for event in CACHE_EVENTS]
+    return fields
+
+
+def _startup_keys():
+    """Returns the names of the warmup counters."""
+    return [STARTUP + ':instances'] + ['{}:{}_ms'.format(STARTUP, step)
+                                       for step in STARTUP_STEPS]
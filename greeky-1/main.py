@@ -1,48 +1,215 @@
 #!/usr/bin/env python
 
 """main.py - This file contains handlers that are called by taskqueue and/or
-cronjobs."""
-import webapp2
-from google.appengine.api import (
-    mail,
-    app_identity,
-)
+cronjobs. Each handler imports the modules it needs when it runs, so that a
+new instance does not load them all before its first request."""
+import json
 
-from api import HangmanApi
-from models.user import User
-from models.game import Game
+import webapp2
+from google.appengine.api import taskqueue
 
 
 class SendReminderEmail(webapp2.RequestHandler):
     def get(self):
-        """Send a reminder email to each User with an email who has
-        games in progress. Email body includes a count of active
-        games and their urlsafe keys
+        """Start the run that sends a reminder email to each User with an
+        email who has games in progress. The run is processed in batches by
+        SendReminderBatch.
         Called every everyday at 9:00 AM"""
-        users = User.query()
-        for user in users:
-            # Get all the unfinished user games.
-            games = Game.query(Game.user == user.key, Game.game_over == False)
-            if games.count() > 0:
-                subject = 'This is a reminder!'
-                body = 'Hello {0}, This is a reminder that you have Hangman game in progress! ' \
-                       'Let\'s play and have some fun!'\
-                    .format(user.name)
-                # This will send emails to the users who have pending active games.
-                mail.send_mail('noreply@{}.appspotmail.com'.
-                               format(app_identity.get_application_id()),
-                               user.email,
-                               subject,
-                               body)
+        import reminders
+        reminders.start_run()
+
+
+class SendReminderBatch(webapp2.RequestHandler):
+    def post(self):
+        """Send the reminder emails of one batch of users and enqueue the next
+        batch."""
+        import reminders
+        reminders.send_batch(self.request.get('run'),
+                             int(self.request.get('batch')))
+        self.response.set_status(204)
+
+
+class ReconcileAverageMovesRemaining(webapp2.RequestHandler):
+    def get(self):
+        """Recompute the running totals behind the average moves remaining.
+        Called every hour"""
+        import rollup
+        rollup.reconcile_active_games()
+        self.response.set_status(204)
+
+
+class RollupUserCounters(webapp2.RequestHandler):
+    def get(self):
+        """Start rolling up the user counter shards onto the Users.
+        Called every 15 minutes"""
+        taskqueue.add(url='/tasks/rollup_user_counters')
+        self.response.set_status(202)
+
+
+class RollupUserCountersBatch(webapp2.RequestHandler):
+    def post(self):
+        """Roll up one batch of counter shards and enqueue the next batch."""
+        import rollup
+        cursor = rollup.rollup_user_counters(self.request.get('cursor') or None)
+        if cursor:
+            taskqueue.add(url='/tasks/rollup_user_counters', params={'cursor': cursor})
+        self.response.set_status(204)
+
+
+class RecordUserStats(webapp2.RequestHandler):
+    def post(self):
+        """Add the Score of a finished game to its user's UserStats."""
+        from google.appengine.ext import ndb
+        from models.score import Score
+        from models.stats import UserStats
+        score = ndb.Key(urlsafe=self.request.get('score')).get()
+        if isinstance(score, Score):
+            UserStats.record(score, self.request.get('user'))
+        self.response.set_status(204)
+
+
+class RecordLeaderboard(webapp2.RequestHandler):
+    def post(self):
+        """Offer the Score of a won game to the leaderboard."""
+        from google.appengine.ext import ndb
+        from models.leaderboard import Leaderboard
+        from models.score import Score
+        score = ndb.Key(urlsafe=self.request.get('score')).get()
+        if isinstance(score, Score):
+            Leaderboard.record(score, self.request.get('user'))
+        self.response.set_status(204)
+
+
+class MigrateUserKeys(webapp2.RequestHandler):
+    def get(self):
+        """Start re-keying the Users by name."""
+        taskqueue.add(url='/tasks/migrate_user_keys')
+        self.response.set_status(202)
+
+    def post(self):
+        """Re-key one batch of Users and enqueue the next batch."""
+        import migrations
+        cursor = migrations.migrate_user_keys(self.request.get('cursor') or None)
+        if cursor:
+            taskqueue.add(url='/tasks/migrate_user_keys', params={'cursor': cursor})
+        self.response.set_status(204)
 
 
-class UpdateAverageMovesRemaining(webapp2.RequestHandler):
+class ArchiveGames(webapp2.RequestHandler):
+    def get(self):
+        """Start archiving the finished Games and expiring the idle ones.
+        Called every day at 3:00 AM"""
+        taskqueue.add(url='/tasks/archive_games', params={'expired': ''})
+        taskqueue.add(url='/tasks/archive_games', params={'expired': '1'})
+        self.response.set_status(202)
+
+
+class ArchiveGamesBatch(webapp2.RequestHandler):
+    def post(self):
+        """Archive one batch of Games and enqueue the next batch."""
+        import archival
+        expired = bool(self.request.get('expired'))
+        cursor = archival.archive_games(expired, self.request.get('cursor') or None)
+        if cursor:
+            taskqueue.add(url='/tasks/archive_games',
+                          params={'expired': self.request.get('expired'),
+                                  'cursor': cursor})
+        self.response.set_status(204)
+
+
+class StampLastMove(webapp2.RequestHandler):
+    def get(self):
+        """Start setting the last move time of the Games written before it
+        was recorded."""
+        taskqueue.add(url='/tasks/stamp_last_move')
+        self.response.set_status(202)
+
+    def post(self):
+        """Stamp one batch of Games and enqueue the next batch."""
+        import migrations
+        cursor = migrations.stamp_last_move(self.request.get('cursor') or None)
+        if cursor:
+            taskqueue.add(url='/tasks/stamp_last_move', params={'cursor': cursor})
+        self.response.set_status(204)
+
+
+class BackfillUserStats(webapp2.RequestHandler):
+    def get(self):
+        """Start building the UserStats of existing Users from their Scores."""
+        taskqueue.add(url='/tasks/backfill_user_stats')
+        self.response.set_status(202)
+
     def post(self):
-        """Update average moves remaining in memcache."""
-        HangmanApi._cache_average_attempts()
+        """Build the UserStats of one batch of Users and enqueue the next
+        batch."""
+        import migrations
+        cursor = migrations.backfill_user_stats(self.request.get('cursor') or None)
+        if cursor:
+            taskqueue.add(url='/tasks/backfill_user_stats', params={'cursor': cursor})
         self.response.set_status(204)
 
+
+class CreateUniqueMarkers(webapp2.RequestHandler):
+    def get(self):
+        """Start creating the unique name and email markers of existing
+        Users."""
+        taskqueue.add(url='/tasks/create_unique_markers')
+        self.response.set_status(202)
+
+    def post(self):
+        """Create the markers of one batch of Users and enqueue the next
+        batch."""
+        import migrations
+        cursor = migrations.create_unique_markers(self.request.get('cursor') or None)
+        if cursor:
+            taskqueue.add(url='/tasks/create_unique_markers', params={'cursor': cursor})
+        self.response.set_status(204)
+
+
+class Warmup(webapp2.RequestHandler):
+    def get(self):
+        """Import the API and prime its hot caches before the instance
+        receives traffic.
+        Called by App Engine when it starts an instance"""
+        import warmup
+        warmup.warm_up()
+        self.response.set_status(204)
+
+
+class Metrics(webapp2.RequestHandler):
+    def get(self):
+        """Return the per-endpoint latency histograms, RPC counts, entity
+        bytes and cache hit rates aggregated over all instances."""
+        import instrumentation
+        # The endpoints register with instrumentation when the API loads.
+        import api
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(instrumentation.snapshot(), indent=2,
+                                       sort_keys=True))
+
+    def delete(self):
+        """Clear the aggregated metrics."""
+        import instrumentation
+        # The endpoints register with instrumentation when the API loads.
+        import api
+        instrumentation.reset()
+        self.response.set_status(204)
+
+
 app = webapp2.WSGIApplication([
     ('/crons/send_reminder', SendReminderEmail),
-    ('/tasks/cache_average_attempts', UpdateAverageMovesRemaining),
+    ('/tasks/send_reminders', SendReminderBatch),
+    ('/crons/reconcile_average_attempts', ReconcileAverageMovesRemaining),
+    ('/crons/archive_games', ArchiveGames),
+    ('/tasks/archive_games', ArchiveGamesBatch),
+    ('/crons/rollup_user_counters', RollupUserCounters),
+    ('/tasks/rollup_user_counters', RollupUserCountersBatch),
+    ('/tasks/record_user_stats', RecordUserStats),
+    ('/tasks/record_leaderboard', RecordLeaderboard),
+    ('/tasks/migrate_user_keys', MigrateUserKeys),
+    ('/tasks/backfill_user_stats', BackfillUserStats),
+    ('/tasks/stamp_last_move', StampLastMove),
+    ('/tasks/create_unique_markers', CreateUniqueMarkers),
+    ('/admin/metrics', Metrics),
+    ('/_ah/warmup', Warmup),
 ], debug=True)
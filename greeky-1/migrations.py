@@ -0,0 +1,157 @@
+"""migrations.py - This file contains batched data migrations. Each call
+migrates one page of entities and returns the cursor of the next page, so the
+task handlers in main.py can chain them across requests."""
+
+import logging
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+import cache
+from models.game import Game
+from models.score import Score
+from models.stats import UserStats
+from models.user import UniqueMarker, User
+
+MIGRATION_BATCH_SIZE = 50
+
+
+def migrate_user_keys(urlsafe_cursor=None):
+    """Re-keys one page of Users stored with numeric ids under their name and
+    points their Games and Scores at the new key. Safe to re-run: users that
+    are already keyed by name are skipped, and a copy left by an interrupted
+    run is reused.
+    Args:
+        urlsafe_cursor: The cursor returned for the previous page, or None to
+            start from the first page.
+    Returns:
+        The urlsafe cursor of the next page, or None when done.
+    """
+    cursor = Cursor(urlsafe=urlsafe_cursor) if urlsafe_cursor else None
+    users, next_cursor, more = User.query().fetch_page(
+            MIGRATION_BATCH_SIZE, start_cursor=cursor)
+    for user in users:
+        if user.key.id() != user.name:
+            _rekey_user(user)
+    if not more or not next_cursor:
+        return None
+    return next_cursor.urlsafe()
+
+
+def _rekey_user(user):
+    """Moves a User to the key of its name and deletes the old entity."""
+    old_key = user.key
+    new_key = ndb.Key(User, user.name)
+    if not new_key.get():
+        User(key=new_key, **user.to_dict()).put()
+
+    for model in (Game, Score):
+        entities = model.query(model.user == old_key).fetch()
+        for entity in entities:
+            entity.user = new_key
+        ndb.put_multi(entities)
+    old_key.delete()
+
+
+def backfill_user_stats(urlsafe_cursor=None):
+    """Builds the UserStats of one page of Users from their Scores. Safe to
+    re-run: stats that are already complete are skipped.
+    Args:
+        urlsafe_cursor: The cursor returned for the previous page, or None to
+            start from the first page.
+    Returns:
+        The urlsafe cursor of the next page, or None when done.
+    """
+    cursor = Cursor(urlsafe=urlsafe_cursor) if urlsafe_cursor else None
+    users, next_cursor, more = User.query().fetch_page(
+            MIGRATION_BATCH_SIZE, start_cursor=cursor)
+    stats = ndb.get_multi([ndb.Key(UserStats, user.name) for user in users])
+    for user, user_stats in zip(users, stats):
+        if not (user_stats and user_stats.complete):
+            _backfill_user_stats(user)
+    if not more or not next_cursor:
+        return None
+    return next_cursor.urlsafe()
+
+
+def _backfill_user_stats(user):
+    """Rebuilds the UserStats of a user from all of their Scores, replacing
+    the partial stats of games that ended since the stats were introduced.
+    Scores stored before finish times were recorded only have the day a game
+    ended, so among those streaks follow the order of the days and not of the
+    games within a day."""
+    scores = sorted(Score.query(Score.user == user.key),
+                    key=lambda score: (score.date, score.finished is not None,
+                                       score.finished))
+
+    @ndb.transactional
+    def write():
+        if getattr(UserStats.get_by_id(user.name), 'complete', False):
+            return
+        stats = UserStats(id=user.name, complete=True)
+        for score in scores:
+            stats.add(score)
+        stats.put()
+    write()
+
+
+def stamp_last_move(urlsafe_cursor=None):
+    """Sets the last_move of one page of Games written before it existed, to
+    the time of the migration, so that archival.py can find them. Safe to
+    re-run: games that have a last_move are skipped.
+    Args:
+        urlsafe_cursor: The cursor returned for the previous page, or None to
+            start from the first page.
+    Returns:
+        The urlsafe cursor of the next page, or None when done.
+    """
+    cursor = Cursor(urlsafe=urlsafe_cursor) if urlsafe_cursor else None
+    games, next_cursor, more = Game.query().fetch_page(
+            MIGRATION_BATCH_SIZE, start_cursor=cursor)
+    with cache.batch():
+        # last_move is set automatically when the games are put.
+        ndb.put_multi([game for game in games if game.last_move is None])
+    if not more or not next_cursor:
+        return None
+    return next_cursor.urlsafe()
+
+
+def create_unique_markers(urlsafe_cursor=None):
+    """Creates the UniqueMarkers of the name and email of one page of Users
+    created before the markers existed. Safe to re-run: markers that exist
+    are kept. A name or email already claimed by another user, a duplicate
+    from before the markers, is logged for an admin to resolve.
+    Args:
+        urlsafe_cursor: The cursor returned for the previous page, or None to
+            start from the first page.
+    Returns:
+        The urlsafe cursor of the next page, or None when done.
+    """
+    cursor = Cursor(urlsafe=urlsafe_cursor) if urlsafe_cursor else None
+    users, next_cursor, more = User.query().fetch_page(
+            MIGRATION_BATCH_SIZE, start_cursor=cursor)
+    claims = []
+    for user in users:
+        claims.append((UniqueMarker.marker_key('name', user.name), user))
+        if user.email is not None:
+            claims.append((UniqueMarker.marker_key('email', user.email), user))
+    markers = ndb.get_multi([key for key, _ in claims])
+    for (key, user), marker in zip(claims, markers):
+        owner = marker.user if marker else _claim_marker(key, user.key)
+        if owner != user.key:
+            logging.warning('%s of User %s is already claimed by User %s',
+                            key.id(), user.key.id(), owner.id() if owner else None)
+    if not more or not next_cursor:
+        return None
+    return next_cursor.urlsafe()
+
+
+@ndb.transactional
+def _claim_marker(key, user_key):
+    """Creates a marker for a user unless it exists, and returns the key of
+    the user the marker belongs to."""
+    marker = key.get()
+    if marker is None:
+        marker = UniqueMarker(key=key, user=user_key)
+        marker.put()
+    return marker.user
@@ -0,0 +1,176 @@
+"""aggregate.py - This file contains the sharded running totals kept over the
+active Games, so that averages can be read without scanning the Games, and
+the sharded win counters of each User, so that a user's games can finish
+concurrently without contending for the User entity."""
+
+import random
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from engine import rules
+from models.user import User
+
+NUM_SHARDS = 20
+USER_COUNTER_SHARDS = 5
+MEMCACHE_USER_COUNTERS = 'user_counters:'
+# Bounds how long a counter total cached while a rollup ran can be stale.
+USER_COUNTERS_TTL = 600
+
+
+class ActiveGamesShard(ndb.Model):
+    """One shard of the count and attempts_remaining total of active games.
+    Updates pick a random shard so that concurrent games rarely contend for
+    the same entity group."""
+    games = ndb.IntegerProperty(default=0, indexed=False)
+    attempts_remaining = ndb.IntegerProperty(default=0, indexed=False)
+
+    @classmethod
+    def shard_keys(cls):
+        """Returns the keys of all the shards."""
+        return [ndb.Key(cls, shard) for shard in range(1, NUM_SHARDS + 1)]
+
+    @classmethod
+    def add(cls, games, attempts_remaining):
+        """Adds deltas to the running totals on a random shard.
+        Args:
+            games: The change in the number of active games.
+            attempts_remaining: The change in the total attempts remaining.
+        """
+        cls.add_async(games, attempts_remaining).get_result()
+
+    @classmethod
+    @ndb.transactional_tasklet
+    def add_async(cls, games, attempts_remaining):
+        """Like add, but returns a Future, so that the update can overlap
+        other RPCs."""
+        key = ndb.Key(cls, random.randint(1, NUM_SHARDS))
+        shard = (yield key.get_async()) or cls(key=key)
+        shard.games += games
+        shard.attempts_remaining += attempts_remaining
+        yield shard.put_async()
+
+    @classmethod
+    def totals(cls):
+        """Returns the number of active games and the total of their attempts
+        remaining, summed over the shards."""
+        shards = [shard for shard in ndb.get_multi(cls.shard_keys()) if shard]
+        return (sum(shard.games for shard in shards),
+                sum(shard.attempts_remaining for shard in shards))
+
+    @classmethod
+    def average(cls):
+        """Returns the average attempts remaining of the active games, or None
+        if there are no active games."""
+        games, attempts_remaining = cls.totals()
+        if games <= 0:
+            return None
+        return attempts_remaining / float(games)
+
+    @classmethod
+    @ndb.transactional(xg=True)
+    def reset(cls, games, attempts_remaining):
+        """Overwrites all the shards with totals computed by a full scan.
+        Args:
+            games: The number of active games.
+            attempts_remaining: The total attempts remaining of the active games.
+        """
+        shards = [cls(key=key) for key in cls.shard_keys()]
+        shards[0].games = games
+        shards[0].attempts_remaining = attempts_remaining
+        ndb.put_multi(shards)
+
+
+class UserCounterShard(ndb.Model):
+    """One shard of the games a user won and played since the counters were
+    last rolled up onto the User. The shards are root entities keyed
+    '<shard>:<user name>', so that concurrent games of one user rarely
+    contend for the same entity group, and rollup() deletes them once their
+    counts are on the User, so the existing shards are the users to roll up."""
+    won = ndb.IntegerProperty(default=0, indexed=False)
+    total_played = ndb.IntegerProperty(default=0, indexed=False)
+
+    @classmethod
+    def shard_keys(cls, user_name):
+        """Returns the keys of all the shards of a user."""
+        return [ndb.Key(cls, u'{}:{}'.format(shard, user_name))
+                for shard in range(1, USER_COUNTER_SHARDS + 1)]
+
+    @staticmethod
+    def user_name(key):
+        """Returns the name of the user a shard key belongs to."""
+        return key.id().split(':', 1)[1]
+
+    @classmethod
+    @ndb.transactional_tasklet
+    def add_async(cls, user_name, won):
+        """Counts a finished game on a random shard of its user. Call it
+        inside the transaction that stores the game's Score, then
+        invalidate() once it has committed.
+        Args:
+            user_name: The name of the game's user.
+            won: Whether the user won the game.
+        Returns:
+            Future: Done once the shard is written.
+        """
+        key = ndb.Key(cls, u'{}:{}'.format(
+                random.randint(1, USER_COUNTER_SHARDS), user_name))
+        shard = (yield key.get_async()) or cls(key=key)
+        shard.won += int(won)
+        shard.total_played += 1
+        yield shard.put_async()
+
+    @staticmethod
+    def invalidate(user_names):
+        """Drops the cached counters of users."""
+        memcache.delete_multi(list(user_names), key_prefix=MEMCACHE_USER_COUNTERS)
+
+    @classmethod
+    def counters(cls, users):
+        """Returns the exact counters of users: the counts rolled up onto
+        each User plus those of its shards, from memcache when cached.
+        Args:
+            users: User entities.
+        Returns:
+            dict: (won, total_played, win_ratio) by user name.
+        """
+        totals = memcache.get_multi([user.name for user in users],
+                                    key_prefix=MEMCACHE_USER_COUNTERS)
+        missing = [user for user in users if user.name not in totals]
+        if missing:
+            shards = ndb.get_multi([key for user in missing
+                                    for key in cls.shard_keys(user.name)])
+            fresh = {}
+            for i, user in enumerate(missing):
+                user_shards = [shard for shard in shards[i * USER_COUNTER_SHARDS:
+                                                         (i + 1) * USER_COUNTER_SHARDS]
+                               if shard]
+                fresh[user.name] = (
+                        user.won + sum(shard.won for shard in user_shards),
+                        user.total_played + sum(shard.total_played
+                                                for shard in user_shards))
+            memcache.set_multi(fresh, key_prefix=MEMCACHE_USER_COUNTERS,
+                               time=USER_COUNTERS_TTL)
+            totals.update(fresh)
+        return dict((name, (won, total_played, rules.win_ratio(won, total_played)))
+                    for name, (won, total_played) in totals.iteritems())
+
+    @classmethod
+    @ndb.transactional(xg=True)
+    def rollup(cls, user_name):
+        """Moves the counts of a user's shards onto the User, refreshing the
+        win_ratio that get_user_rankings sorts by, and deletes the shards.
+        Args:
+            user_name: The name of the user.
+        """
+        entities = ndb.get_multi([ndb.Key(User, user_name)] +
+                                 cls.shard_keys(user_name))
+        user, shards = entities[0], [shard for shard in entities[1:] if shard]
+        if not shards:
+            return
+        if user:
+            user.won += sum(shard.won for shard in shards)
+            user.total_played += sum(shard.total_played for shard in shards)
+            user.win_ratio = rules.win_ratio(user.won, user.total_played)
+            user.put()
+        ndb.delete_multi([shard.key for shard in shards])
@@ -0,0 +1,43 @@
+"""archive.py - This file contains the cold storage of finished and expired
+Games. Archived games keep their whole history but nothing is indexed, so
+they cost no index writes and stay out of the queries over active games."""
+
+from google.appengine.ext import ndb
+
+from engine import rules
+from models.properties import WordProperty, MoveHistoryProperty
+
+
+class ArchivedGame(ndb.Model):
+    """A Game moved out of the Game kind, keyed by the Game's id"""
+    _use_memcache = False
+
+    user = ndb.KeyProperty(kind='User', indexed=False)
+    answer = WordProperty('answer', required=True)
+    attempts = ndb.IntegerProperty(indexed=False)
+    attempts_remaining = ndb.IntegerProperty(indexed=False)
+    # None for a game that expired before it ended.
+    won = ndb.BooleanProperty(indexed=False)
+    expired = ndb.BooleanProperty(default=False, indexed=False)
+    # The whole history, from the game's pages and the game itself.
+    moves = MoveHistoryProperty('moves', compressed=True)
+    last_move = ndb.DateTimeProperty(indexed=False)
+    archived = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+    @classmethod
+    def from_game(cls, game, moves, expired):
+        """Returns the unsaved archive of a game.
+        Args:
+            game: The Game to archive.
+            moves: The game's whole move history.
+            expired: True if the game is archived unfinished.
+        Returns:
+            ArchivedGame: The archive, keyed by the game's id.
+        """
+        won = None
+        if not expired:
+            won = bool(moves) and moves[-1][1] == rules.GUESS_WIN
+        return cls(id=game.key.id(), user=game.user, answer=game.answer,
+                   attempts=game.attempts, attempts_remaining=game.attempts_remaining,
+                   won=won, expired=expired, moves=list(moves),
+                   last_move=game.last_move)
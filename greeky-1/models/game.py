@@ -1,45 +1,197 @@
-from datetime import date
+import functools
 
+from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
-from models.score import Score
+
+import cache
+from engine import rules
+from models.aggregate import UserCounterShard
+from models.properties import BitmaskProperty, WordProperty, MoveHistoryProperty
 from protorpc import messages
 
+# Moves kept on the Game before they are moved to a GameHistoryPage.
+HISTORY_PAGE_SIZE = 16
+
+
+class StaleGameError(ValueError):
+    """Raised when a game is saved after another request changed it."""
+
+    def __init__(self):
+        super(StaleGameError, self).__init__(
+                'The game was changed by another move.')
+
 
 class Game(ndb.Model):
     """Game object"""
-    answer = ndb.PickleProperty(required=True)
-    user_answer = ndb.PickleProperty()
+    # Games are cached by cache.py, read through utils.get_by_urlsafe.
+    _use_memcache = False
+    _use_entity_cache = True
+
+    answer = WordProperty('answer', required=True)
     attempts = ndb.IntegerProperty(required=True, default=6)
     attempts_remaining = ndb.IntegerProperty(required=False)
     game_over = ndb.BooleanProperty(required=True, default=False)
     user = ndb.KeyProperty(required=True, kind='User')
-    move_history = ndb.PickleProperty()
+    # (letter, result, attempts_remaining) records since the last full
+    # GameHistoryPage, read through history().
+    moves = MoveHistoryProperty('moves')
+    # Number of full GameHistoryPages stored as children of the game.
+    history_pages = ndb.IntegerProperty(default=0, indexed=False)
+    # Bitmask of the positions revealed before the first move in moves.
+    history_revealed = BitmaskProperty(default=0, indexed=False)
+    # Letter -> bitmask of the answer positions holding that letter.
+    letter_positions = ndb.JsonProperty()
+    # Bitmask of the answer positions the player has already revealed.
+    revealed = BitmaskProperty(default=0, indexed=False)
+    letters_remaining = ndb.IntegerProperty(indexed=False)
+    # Set on every write, to archive finished games and expire idle ones.
+    last_move = ndb.DateTimeProperty(auto_now=True)
+    # Bumped by every save_move and served as the game's etag. The put hook
+    # caches it apart from the game, see cache.get_version.
+    version = ndb.IntegerProperty(default=0, indexed=False)
+    # Pickled lists written by earlier versions, converted on first use.
+    legacy_user_answer = ndb.PickleProperty('user_answer')
+    legacy_move_history = ndb.PickleProperty('move_history')
+
+    def _post_put_hook(self, future):
+        """Writes the stored game and its version through the entity cache
+        once committed."""
+        if future.get_exception() is None:
+            ndb.get_context().call_on_commit(functools.partial(cache.set, self))
+
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        """Invalidates the cached copy of a deleted game."""
+        cache.delete(key.urlsafe())
 
     @classmethod
-    def new_game(cls, user, answer, attempts):
-        """Creates and returns a new game.
+    def build(cls, user, answer, attempts, key=None):
+        """Returns a new, unsaved game.
         Args:
            user: The user who created the game.
            answer: The answer for the game.
            attempts: The maximum number of attempts allowed.
+           key: The key to store the game under, allocated on put when None.
         Returns:
            Game: A new Game object with the initialized values.
         """
-        if attempts is None:
-            attempts = 6
-        elif attempts <= 0:
-            raise ValueError('Attempts has to be over 0.')
-        attempts_remaining = attempts
-        game = Game(user=user,
-                    attempts=attempts,
-                    game_over=False)
-        game.answer = list(answer)
-        game.user_answer = [''] * len(game.answer)
-        game.attempts_remaining = attempts_remaining
-        game.move_history = []
-        game.put()
+        game = Game(key=key, user=user)
+        rules.start_game(game, answer, attempts)
+        game.moves = []
         return game
 
+    def build_index(self):
+        """Builds the letter to positions index, the revealed bitmask and the
+        count of letters still hidden from answer and the legacy user_answer.
+        Games created before the index existed are indexed lazily on their
+        next guess.
+        """
+        rules.index_answer(self, self.legacy_user_answer)
+        self.legacy_user_answer = None
+
+    @property
+    def user_answer(self):
+        """The answer as a list of letters, blank where not yet revealed."""
+        return rules.reveal(self.answer, self.revealed)
+
+    @property
+    def user_name(self):
+        """The name of the game's user, which Users are keyed by."""
+        return self.user.id()
+
+    def history(self):
+        """Returns the moves since the last full GameHistoryPage as a list of
+        (letter, result, attempts_remaining) records, converting a legacy
+        history of "Guess: x, Result: message" strings on first use."""
+        if self.moves is None:
+            moves = []
+            attempts_remaining = self.attempts
+            for entry in self.legacy_move_history or []:
+                guess, message = entry[0].split(', Result: ', 1)
+                if message.startswith('Wrong!'):
+                    result = rules.GUESS_MISS
+                    attempts_remaining -= 1
+                elif message.startswith('Game Over'):
+                    result = rules.GUESS_LOSE
+                    attempts_remaining -= 1
+                elif message.startswith('You win!'):
+                    result = rules.GUESS_WIN
+                else:
+                    result = rules.GUESS_HIT
+                moves.append((guess[len('Guess: '):], result, attempts_remaining))
+            self.moves = moves
+            self.legacy_move_history = None
+        return self.moves
+
+    @property
+    def move_count(self):
+        """The number of moves in the whole history."""
+        return self.history_pages * HISTORY_PAGE_SIZE + len(self.history())
+
+    def history_page_keys(self):
+        """Returns the keys of the game's stored GameHistoryPages."""
+        return [GameHistoryPage.page_key(self.key, number)
+                for number in range(self.history_pages)]
+
+    def full_history(self):
+        """Returns every move of the game, loading all its stored pages."""
+        moves = []
+        for page in ndb.get_multi(self.history_page_keys()):
+            moves.extend(page.moves)
+        return moves + self.history()
+
+    def history_since(self, since, limit):
+        """Returns a slice of the move history, loading only the stored pages
+        that overlap it.
+        Args:
+           since: The number of the first move wanted, counting from 0.
+           limit: The maximum number of moves wanted.
+        Returns:
+           A list of (number, letter, message, attempts_remaining) records.
+        """
+        if self.letter_positions is None:
+            self.build_index()
+        stored = self.history_pages * HISTORY_PAGE_SIZE
+        stop = min(since + limit, self.move_count)
+        if since >= stop:
+            return []
+
+        first_page = min(since // HISTORY_PAGE_SIZE, self.history_pages)
+        last_page = min(self.history_pages, (stop - 1) // HISTORY_PAGE_SIZE + 1)
+        runs = [(page.revealed, page.moves) for page in ndb.get_multi(
+                [GameHistoryPage.page_key(self.key, number)
+                 for number in range(first_page, last_page)])]
+        if stop > stored:
+            runs.append((self.history_revealed, self.history()))
+
+        records = []
+        number = first_page * HISTORY_PAGE_SIZE
+        for revealed, moves in runs:
+            records.extend(rules.replay_moves(self, moves, revealed, number,
+                                              since, stop))
+            number += len(moves)
+        return records
+
+    def _page_history(self):
+        """Moves the full pages of the history out of the game.
+        Returns:
+           The new, unsaved GameHistoryPages, which are children of the game.
+        """
+        if self.letter_positions is None:
+            self.build_index()
+        pages = []
+        moves = self.history()
+        while len(moves) >= HISTORY_PAGE_SIZE:
+            page_moves, moves = moves[:HISTORY_PAGE_SIZE], moves[HISTORY_PAGE_SIZE:]
+            pages.append(GameHistoryPage(
+                    key=GameHistoryPage.page_key(self.key, self.history_pages),
+                    moves=page_moves, revealed=self.history_revealed))
+            for letter, _, _ in page_moves:
+                self.history_revealed |= self.letter_positions.get(letter, 0)
+            self.history_pages += 1
+        self.moves = moves
+        return pages
+
     def to_form(self, message):
         """Returns a GameForm representation of the Game.
         Args:
@@ -49,51 +201,159 @@ class Game(ndb.Model):
         """
         form = GameForm()
         form.urlsafe_key = self.key.urlsafe()
-        form.user_name = self.user.get().name
+        form.user_name = self.user_name
         form.attempts = self.attempts
         form.attempts_remaining = self.attempts_remaining
         form.game_over = self.game_over
         form.message = message
+        form.etag = self.etag()
         return form
 
-    def end_game(self, won=False):
-        """Ends the game - if won is True, the player won. - if won is False,
-        the player lost. Creates a Score object and stores it in the datastore.
+    def etag(self):
+        """Returns the game's etag, which changes with every move."""
+        return str(self.version)
+
+    def save_move(self, score=None):
+        """Writes the game and any history page it filled in a transaction
+        that first checks the stored game still has the version this one was
+        loaded with, so that of two concurrent moves only one is stored. A
+        finished game's new score is written in the same transaction, which
+        also counts the game on one of the user's UserCounterShards and
+        enqueues the task that adds it to their UserStats, so the User entity
+        itself is not written, and for a win the task that offers it to the
+        leaderboard. Every save bumps the game's version.
+        The check is kept on plain moves too, where it costs one
+        transactional Get and a Commit more than a blind put. Without it, a
+        concurrent move could overwrite this one and drop it from the
+        history. make_moves spends one check on a whole batch.
         Args:
-           won: Indicates whether the player wins or loses.
+           score: The game's new Score, if the game ended.
+        Raises:
+           StaleGameError: If the game was changed since it was loaded.
+        """
+        loaded_version = self.version
+        self.version += 1
+        entities = [entity for entity in (self, score) if entity]
+        entities.extend(self._page_history())
+
+        @ndb.tasklet
+        def write():
+            stored = yield self.key.get_async(use_cache=False)
+            if stored is None or stored.version != loaded_version:
+                raise StaleGameError()
+            if not score:
+                yield ndb.put_multi_async(entities)
+                return
+            # The shard is read while the entities are written; the task
+            # needs the score's key, so it is enqueued once they are.
+            yield ndb.put_multi_async(entities) + [
+                    UserCounterShard.add_async(self.user_name, score.won)]
+            params = {'score': score.key.urlsafe(), 'user': self.user_name}
+            tasks = [taskqueue.Task(url='/tasks/record_user_stats', params=params)]
+            if score.won:
+                tasks.append(taskqueue.Task(url='/tasks/record_leaderboard',
+                                            params=params))
+            yield taskqueue.Queue().add_async(tasks, transactional=True)
+        ndb.transaction(write, xg=bool(score))
+        if score:
+            UserCounterShard.invalidate([self.user_name])
+
+    def cancel(self):
+        """Deletes the game and its history pages in a transaction that first
+        checks the stored game still has the version this one was loaded
+        with, as save_move does.
+        Raises:
+           StaleGameError: If the game was changed or deleted since it was
+               loaded.
         """
-        self.game_over = True
-        self.put()
-        # Add the game to the score 'board'
-        score = Score(
-                user=self.user, date=date.today(), won=won,
-                attempts_used=self.attempts - self.attempts_remaining,
-                attempts=self.attempts)
-        score.put()
+        @ndb.tasklet
+        def delete():
+            stored = yield self.key.get_async(use_cache=False)
+            if stored is None or stored.version != self.version:
+                raise StaleGameError()
+            yield ndb.delete_multi_async([self.key] + self.history_page_keys())
+        ndb.transaction(delete)
+
+
+class GameHistoryPage(ndb.Model):
+    """A full page of HISTORY_PAGE_SIZE moves of a Game, stored as its child
+    so that a tail of the history is served without loading the pages before
+    it. Pages never change once written."""
+    moves = MoveHistoryProperty('moves')
+    # Bitmask of the positions revealed before the first move of the page.
+    revealed = BitmaskProperty(default=0, indexed=False)
+
+    @classmethod
+    def page_key(cls, game_key, number):
+        """Returns the key of a game's page, numbered from 0."""
+        return ndb.Key(cls, number + 1, parent=game_key)
 
 
 class GameForm(messages.Message):
-    """GameForm for outbound game state information"""
+    """GameForm for outbound game state information. A not_modified form only
+    carries the urlsafe_key and etag."""
     urlsafe_key = messages.StringField(1, required=True)
-    attempts = messages.IntegerField(2, required=True)
-    attempts_remaining = messages.IntegerField(3, required=True)
-    game_over = messages.BooleanField(4, required=True)
-    message = messages.StringField(5, required=True)
-    user_name = messages.StringField(6, required=True)
+    attempts = messages.IntegerField(2)
+    attempts_remaining = messages.IntegerField(3)
+    game_over = messages.BooleanField(4)
+    message = messages.StringField(5)
+    user_name = messages.StringField(6)
+    etag = messages.StringField(7)
+    not_modified = messages.BooleanField(8, default=False)
 
 
 class NewGameForm(messages.Message):
-    """Used to create a new game"""
+    """Used to create a new game. Without an answer, one is picked from the
+    word bank, optionally of a length and difficulty."""
     user_name = messages.StringField(1, required=True)
-    answer = messages.StringField(2, required=True)
+    answer = messages.StringField(2)
     attempts = messages.IntegerField(3, default=6)
+    length = messages.IntegerField(4)
+    difficulty = messages.StringField(5)
+
+
+class NewGameForms(messages.Message):
+    """Used to create many new games"""
+    items = messages.MessageField(NewGameForm, 1, repeated=True)
 
 
 class GameForms(messages.Message):
     """Multiple GameForm container"""
     items = messages.MessageField(GameForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
 
 
-class GameHistory(messages.Message):
-    """Game history"""
+class MoveResultForm(messages.Message):
+    """MoveResultForm for the outcome of one move of a batch"""
     move = messages.StringField(1, required=True)
+    message = messages.StringField(2, required=True)
+
+
+class MoveResultForms(messages.Message):
+    """The outcome of each move of a batch and the final game state"""
+    game = messages.MessageField(GameForm, 1, required=True)
+    results = messages.MessageField(MoveResultForm, 2, repeated=True)
+
+
+class MoveForm(messages.Message):
+    """MoveForm for one move of a game's history"""
+    number = messages.IntegerField(1, required=True)
+    move = messages.StringField(2, required=True)
+    message = messages.StringField(3, required=True)
+    attempts_remaining = messages.IntegerField(4, required=True)
+
+
+class HintForm(messages.Message):
+    """HintForm for the suggested next move of a game"""
+    move = messages.StringField(1)
+    candidates = messages.IntegerField(2, required=True)
+    message = messages.StringField(3, required=True)
+
+
+class GameHistory(messages.Message):
+    """A slice of a game's move history. A not_modified slice only carries
+    the etag."""
+    items = messages.MessageField(MoveForm, 1, repeated=True)
+    move_count = messages.IntegerField(2)
+    etag = messages.StringField(3)
+    not_modified = messages.BooleanField(4, default=False)
@@ -0,0 +1,116 @@
+"""leaderboard.py - This file contains the materialized high score table, kept
+up to date as games are won so that it can be served without a query."""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from engine import rules
+from models.score import Score
+from models.user import User
+
+LEADERBOARD_SIZE = 100
+MEMCACHE_LEADERBOARD = 'LEADERBOARD'
+# Seconds the cached table is kept; changes to it also delete the copy.
+LEADERBOARD_TTL = 600
+
+
+def _rank(entry):
+    return rules.score_rank(entry['attempts_used'], entry['attempts'])
+
+
+class Leaderboard(ndb.Model):
+    """The best LEADERBOARD_SIZE winning scores, best first, stored in a
+    single entity with the user names denormalized."""
+    entries = ndb.JsonProperty(default=[])
+
+    KEY_NAME = 'high_scores'
+
+    @staticmethod
+    def entry(score, user_name):
+        """Returns the leaderboard entry of a winning Score."""
+        return {'score': score.key.id(),
+                'user_name': user_name,
+                'date': str(score.date),
+                'attempts_used': score.attempts_used,
+                'attempts': score.attempts}
+
+    @classmethod
+    def top(cls):
+        """Returns the leaderboard entries, best first, from memcache when
+        cached, else from the datastore, rebuilding the table from the Scores
+        if it does not exist yet."""
+        entries = cls._cached_entries()
+        if entries is None:
+            entries = cls.rebuild().entries
+        return entries
+
+    @classmethod
+    def _cached_entries(cls):
+        """Returns the entries from memcache or the stored table, caching
+        them, or None if the table has never been built."""
+        entries = memcache.get(MEMCACHE_LEADERBOARD)
+        if entries is None:
+            board = cls.get_by_id(cls.KEY_NAME)
+            if board is None:
+                return None
+            entries = board.entries
+            memcache.set(MEMCACHE_LEADERBOARD, entries, time=LEADERBOARD_TTL)
+        return entries
+
+    @classmethod
+    def rebuild(cls):
+        """Rebuilds the table from the winning Scores.
+        Returns:
+            Leaderboard: The stored table.
+        """
+        scores = Score.query(Score.won == True) \
+            .order(Score.attempts_used, -Score.attempts) \
+            .fetch(limit=LEADERBOARD_SIZE)
+        names = User.names_by_key([score.user for score in scores])
+        board = cls(id=cls.KEY_NAME,
+                    entries=[cls.entry(score, names[score.user])
+                             for score in scores])
+        board.put()
+        memcache.delete(MEMCACHE_LEADERBOARD)
+        return board
+
+    @classmethod
+    def record(cls, score, user_name):
+        """Adds a winning Score to the table if it ranks among the best.
+        Wins that cannot qualify are turned away with the cached table,
+        without touching the datastore. Run by the task that save_move
+        enqueues with the score, so a score that is already on the table
+        is not added again.
+        Args:
+            score: The winning Score.
+            user_name: The name of the score's user.
+        """
+        entry = cls.entry(score, user_name)
+        entries = cls._cached_entries()
+        if entries is None:
+            # The query behind the first build is eventually consistent and
+            # may miss the score, which _insert skips if it is already on.
+            entries = cls.rebuild().entries
+        if cls._qualifies(entries, entry):
+            cls._insert(entry)
+            memcache.delete(MEMCACHE_LEADERBOARD)
+
+    @staticmethod
+    def _qualifies(entries, entry):
+        return len(entries) < LEADERBOARD_SIZE or _rank(entry) < _rank(entries[-1])
+
+    @classmethod
+    @ndb.transactional
+    def _insert(cls, entry):
+        board = cls.get_by_id(cls.KEY_NAME)
+        entries = board.entries
+        if any(other.get('score') == entry['score'] for other in entries):
+            return
+        if not cls._qualifies(entries, entry):
+            return
+        position = len(entries)
+        while position > 0 and _rank(entry) < _rank(entries[position - 1]):
+            position -= 1
+        entries.insert(position, entry)
+        board.entries = entries[:LEADERBOARD_SIZE]
+        board.put()
@@ -0,0 +1,74 @@
+"""properties.py - This file contains compact ndb property types for the Game
+entity. The word and move history properties read the values that earlier
+versions stored with PickleProperty, so existing entities are converted the
+next time they are written."""
+
+import pickle
+
+from google.appengine.ext import ndb
+
+from engine import rules
+
+# PickleProperty uses the highest protocol, whose data starts with PROTO.
+_PICKLE_PREFIX = pickle.PROTO
+
+# Bitmasks from this value up do not fit in a signed 64 bit integer.
+_INT64_LIMIT = 1 << 63
+
+
+def is_pickled(value):
+    """Returns True if value was written by a PickleProperty."""
+    return value.startswith(_PICKLE_PREFIX)
+
+
+class WordProperty(ndb.BlobProperty):
+    """A word stored as plain UTF-8. A word pickled as a list of letters is
+    joined back into a string on read. UTF-8 text never starts with the
+    pickle prefix, so the two cannot be confused."""
+
+    def _validate(self, value):
+        if not isinstance(value, basestring):
+            raise TypeError('Expected a string, got {!r}'.format(value))
+
+    def _to_base_type(self, value):
+        return value.encode('utf-8')
+
+    def _from_base_type(self, value):
+        if is_pickled(value):
+            return u''.join(pickle.loads(value))
+        return value.decode('utf-8')
+
+
+class MoveHistoryProperty(ndb.BlobProperty):
+    """A list of (letter, result, attempts_remaining) records packed into a
+    fixed five bytes each."""
+
+    def _validate(self, value):
+        if not isinstance(value, list):
+            raise TypeError('Expected a list of moves, got {!r}'.format(value))
+
+    def _to_base_type(self, value):
+        return rules.pack_moves(value)
+
+    def _from_base_type(self, value):
+        return rules.unpack_moves(value)
+
+
+class BitmaskProperty(ndb.GenericProperty):
+    """A bitmask of answer positions. Bitmasks that fit in a signed 64 bit
+    integer are stored as one, as earlier versions stored them all, and those
+    of answers of 64 letters or more as hexadecimal text."""
+
+    def _validate(self, value):
+        if not isinstance(value, (int, long)) or value < 0:
+            raise TypeError('Expected a bitmask, got {!r}'.format(value))
+
+    def _to_base_type(self, value):
+        if value < _INT64_LIMIT:
+            return value
+        return '{:x}'.format(value)
+
+    def _from_base_type(self, value):
+        if isinstance(value, basestring):
+            return int(value, 16)
+        return value
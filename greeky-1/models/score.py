@@ -5,24 +5,40 @@ classes they can include methods (such as 'to_form' and 'new_game')."""
 from datetime import date
 from protorpc import messages
 from google.appengine.ext import ndb
+from models.user import User
 
 
 class Score(ndb.Model):
     """Score object"""
     user = ndb.KeyProperty(required=True, kind='User')
     date = ndb.DateProperty(required=True)
+    # When the game finished, which orders a user's Scores within a day.
+    finished = ndb.DateTimeProperty(auto_now_add=True)
     won = ndb.BooleanProperty(required=True)
     attempts_used = ndb.IntegerProperty(required=True)
     attempts = ndb.IntegerProperty(required=True)
 
-    def to_form(self):
+    @classmethod
+    def to_forms(cls, scores):
+        """Returns ScoreForm representations of many Scores, resolving all of
+        their users in a single batch.
+        Args:
+            scores: An iterable of Scores.
+        Returns:
+            list: ScoreForms in the same order as scores.
+        """
+        scores = list(scores)
+        names = User.names_by_key([score.user for score in scores])
+        return [score.to_form(names[score.user]) for score in scores]
+
+    def to_form(self, user_name):
         """Returns a ScoreForm representation of the Score.
         Args:
-            None.
+            user_name: The name of the score's user.
         Returns:
             ScoreForm: Form representation of the score.
         """
-        return ScoreForm(user_name=self.user.get().name,
+        return ScoreForm(user_name=user_name,
                          date=str(self.date),
                          won=self.won,
                          attempts_used=self.attempts_used,
@@ -46,4 +62,5 @@ class ScoreForm(messages.Message):
 class ScoreForms(messages.Message):
     """Return multiple ScoreForms"""
     items = messages.MessageField(ScoreForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
 
@@ -0,0 +1,143 @@
+"""stats.py - This file contains the per-user statistics, maintained by a task
+enqueued as each game ends so that they are read with one key lookup instead
+of a scan of the user's Scores."""
+
+from protorpc import messages
+from google.appengine.ext import ndb
+
+from engine import rules
+
+RECORDED_SCORES = 20
+
+class UserStats(ndb.Model):
+    """Aggregates of a user's finished games, keyed by the user's name."""
+    games_played = ndb.IntegerProperty(default=0, indexed=False)
+    games_won = ndb.IntegerProperty(default=0, indexed=False)
+    attempts_used = ndb.IntegerProperty(default=0, indexed=False)
+    # The best win, ranked like the high scores.
+    best_attempts_used = ndb.IntegerProperty(indexed=False)
+    best_attempts = ndb.IntegerProperty(indexed=False)
+    best_date = ndb.DateProperty(indexed=False)
+    current_streak = ndb.IntegerProperty(default=0, indexed=False)
+    longest_streak = ndb.IntegerProperty(default=0, indexed=False)
+    first_played = ndb.DateProperty(indexed=False)
+    last_played = ndb.DateProperty(indexed=False)
+    days_played = ndb.IntegerProperty(default=0, indexed=False)
+    # False until the stats cover the games finished before they existed,
+    # which migrations.backfill_user_stats rebuilds from the Scores.
+    complete = ndb.BooleanProperty(default=False)
+    # Ids of the last Scores added, so that a Score is only added once.
+    recorded_scores = ndb.IntegerProperty(repeated=True, indexed=False)
+    # The finish time of the last Score added. The user's Scores that
+    # finished after it are the ones still to add.
+    recorded_until = ndb.DateTimeProperty(indexed=False)
+
+    @classmethod
+    def record(cls, score, user_name):
+        """Adds the user's Scores that are not in their stats yet, in the
+        order the games finished. Run by the task that save_move enqueues
+        with each Score. The query may not see the latest Scores yet, so the
+        task's own Score is always included, and a Score among the
+        RECORDED_SCORES last added is skipped, so a retried task counts it
+        once.
+        Args:
+            score: The stored Score the task was enqueued with.
+            user_name: The name of the game's user.
+        """
+        # Imported here as models.score imports this module through User.
+        from models.score import Score
+        stats = cls.get_by_id(user_name)
+        query = Score.query(Score.user == score.user)
+        if stats and stats.recorded_until:
+            query = query.filter(Score.finished > stats.recorded_until)
+        scores = query.order(Score.finished).fetch()
+        if score.key not in [other.key for other in scores]:
+            scores.append(score)
+        # Scores stored before finish times were recorded go first.
+        scores.sort(key=lambda other: (other.finished is not None, other.finished))
+        cls._add_scores(user_name, scores)
+
+    @classmethod
+    @ndb.transactional
+    def _add_scores(cls, user_name, scores):
+        stats = cls.get_by_id(user_name)
+        if stats is None:
+            # Users created with create_user start with complete stats, so
+            # these are from before the stats existed and need a backfill.
+            stats = cls(id=user_name)
+        scores = [score for score in scores
+                  if score.key.id() not in stats.recorded_scores]
+        if not scores:
+            return
+        for score in scores:
+            stats.add(score)
+        stats.put()
+
+    def add(self, score):
+        """Adds a Score to the aggregates, in the order the games ended."""
+        self.games_played += 1
+        self.attempts_used += score.attempts_used
+        if score.won:
+            self.games_won += 1
+            self.current_streak += 1
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+            if (self.best_attempts_used is None or
+                    rules.score_rank(score.attempts_used, score.attempts) <
+                    rules.score_rank(self.best_attempts_used, self.best_attempts)):
+                self.best_attempts_used = score.attempts_used
+                self.best_attempts = score.attempts
+                self.best_date = score.date
+        else:
+            self.current_streak = 0
+        if self.first_played is None:
+            self.first_played = score.date
+        if self.last_played != score.date:
+            self.days_played += 1
+            self.last_played = score.date
+        if score.key:
+            self.recorded_scores = (self.recorded_scores +
+                                    [score.key.id()])[-RECORDED_SCORES:]
+        if score.finished and (self.recorded_until is None or
+                               score.finished > self.recorded_until):
+            self.recorded_until = score.finished
+
+    def to_form(self, user_name):
+        """Returns a UserStatsForm representation of the UserStats.
+        Args:
+            user_name: The name of the stats' user.
+        Returns:
+            UserStatsForm: Form representation of the stats.
+        """
+        form = UserStatsForm(user_name=user_name,
+                             games_played=self.games_played,
+                             games_won=self.games_won,
+                             current_streak=self.current_streak,
+                             longest_streak=self.longest_streak,
+                             complete=self.complete)
+        if self.games_played:
+            form.average_attempts_used = self.attempts_used / float(self.games_played)
+            form.games_per_day = self.games_played / float(self.days_played)
+            form.first_played = str(self.first_played)
+            form.last_played = str(self.last_played)
+        if self.best_attempts_used is not None:
+            form.best_attempts_used = self.best_attempts_used
+            form.best_attempts = self.best_attempts
+            form.best_date = str(self.best_date)
+        return form
+
+
+class UserStatsForm(messages.Message):
+    """UserStatsForm for outbound user statistics"""
+    user_name = messages.StringField(1, required=True)
+    games_played = messages.IntegerField(2, required=True)
+    games_won = messages.IntegerField(3, required=True)
+    average_attempts_used = messages.FloatField(4)
+    best_attempts_used = messages.IntegerField(5)
+    best_attempts = messages.IntegerField(6)
+    best_date = messages.StringField(7)
+    current_streak = messages.IntegerField(8, required=True)
+    longest_streak = messages.IntegerField(9, required=True)
+    first_played = messages.StringField(10)
+    last_played = messages.StringField(11)
+    games_per_day = messages.FloatField(12)
+    complete = messages.BooleanField(13, required=True)
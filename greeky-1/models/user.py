@@ -1,15 +1,146 @@
+import unicodedata
+
 from protorpc import messages
 from google.appengine.ext import ndb
 
+from models.stats import UserStats
+
+# Shown in place of the name of a user that has since been deleted.
+DELETED_USER_NAME = u'(deleted user)'
+
+
+def normalize(value):
+    """Returns the form of a name or email compared for uniqueness: NFKC
+    normalized, stripped and lowercased."""
+    return unicodedata.normalize('NFKC', unicode(value)).strip().lower()
+
+
+class UniqueConstraintError(ValueError):
+    """Raised when a new user's name or email is already taken."""
+
+    def __init__(self, label, value):
+        super(UniqueConstraintError, self).__init__(
+                u'A User with {} {} already exists!'.format(label, value))
+        self.label = label
+
+
+class UniqueMarker(ndb.Model):
+    """Claims a normalized user name or email, keyed '<field>:<value>', so
+    that uniqueness is checked with a key lookup and enforced by creating the
+    markers in the transaction that creates the User."""
+    user = ndb.KeyProperty(kind='User', indexed=False)
+
+    @classmethod
+    def marker_key(cls, field, value):
+        """Returns the key of the marker of a field value."""
+        return ndb.Key(cls, u'{}:{}'.format(field, normalize(value)))
+
 
 class User(ndb.Model):
-    """User profile"""
+    """User profile, keyed by the user's name"""
     name = ndb.StringProperty(required=True)
     email = ndb.StringProperty()
     won = ndb.IntegerProperty(default=0)
     total_played = ndb.IntegerProperty(default=0)
     win_ratio = ndb.FloatProperty(default=0.0)
 
+    @classmethod
+    def get_by_name(cls, name):
+        """Returns the User with a name, or None if there is no such user.
+        Args:
+            name: The user's name.
+        Returns:
+            User: The user, fetched by key.
+        """
+        if not name:
+            return None
+        return cls.get_by_id(name)
+
+    @classmethod
+    def create(cls, name, email):
+        """Creates a User, its UniqueMarkers and its empty UserStats in one
+        cross-group transaction.
+        Args:
+            name: The user's name.
+            email: The user's email.
+        Returns:
+            User: The stored user.
+        Raises:
+            UniqueConstraintError: If the name or email is already taken.
+        """
+        return cls.create_async(name, email).get_result()
+
+    @classmethod
+    def create_async(cls, name, email):
+        """Like create, but returns a Future of the stored User, so that many
+        users can be created concurrently."""
+        user = cls(id=name, name=name, email=email)
+        markers = [UniqueMarker(key=UniqueMarker.marker_key('name', name),
+                                user=user.key)]
+        if email is not None:
+            markers.append(UniqueMarker(key=UniqueMarker.marker_key('email', email),
+                                        user=user.key))
+
+        @ndb.tasklet
+        def txn():
+            # The user is keyed by the exact name and its marker by the
+            # normalized one, so both are checked.
+            existing = yield ndb.get_multi_async(
+                    [user.key] + [marker.key for marker in markers])
+            if existing[0] or existing[1]:
+                raise UniqueConstraintError('username', name)
+            if any(existing[2:]):
+                raise UniqueConstraintError('email', email)
+            # Stats created with the user cover all of their (no) games.
+            yield ndb.put_multi_async(
+                    [user, UserStats(id=name, complete=True)] + markers)
+            raise ndb.Return(user)
+        return ndb.transaction_async(txn, xg=True)
+
+    @classmethod
+    def create_multi(cls, users):
+        """Creates many users concurrently, each in its own transaction as by
+        create, without querying for existing users first. For imports.
+        Args:
+            users: (name, email) pairs.
+        Returns:
+            list: The stored User, or the UniqueConstraintError raised for a
+                taken name or email, of each pair in order.
+        """
+        futures = [cls.create_async(name, email) for name, email in users]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.get_result())
+            except UniqueConstraintError, e:
+                results.append(e)
+        return results
+
+    @classmethod
+    def get_by_names(cls, names):
+        """Fetches the Users with the given names in a single batch.
+        Args:
+            names: User names, possibly with duplicates.
+        Returns:
+            dict: The users that exist, by name.
+        """
+        keys = [ndb.Key(cls, name) for name in set(names)]
+        return dict((user.name, user) for user in ndb.get_multi(keys) if user)
+
+    @staticmethod
+    def names_by_key(keys):
+        """Resolves user keys to user names in a single batch.
+        Args:
+            keys: User keys, possibly with duplicates.
+        Returns:
+            dict: The name of each distinct user, by key, with
+            DELETED_USER_NAME standing in for users that no longer exist.
+        """
+        unique_keys = list(set(keys))
+        users = ndb.get_multi(unique_keys)
+        return dict((key, user.name if user else DELETED_USER_NAME)
+                    for key, user in zip(unique_keys, users))
+
     def to_form(self):
         """Returns a UserForm representation of the User.
         Args:
@@ -38,3 +169,4 @@ class UserForm(messages.Message):
 class UserForms(messages.Message):
     """Container for multiple User Forms"""
     items = messages.MessageField(UserForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
@@ -0,0 +1,113 @@
+"""reminders.py - This file contains the daily reminder email run. The users
+with active games are read from the Game(game_over, user) index in batches,
+each batch processed by its own task, with the position of the run
+checkpointed after every batch so an interrupted run resumes where it
+stopped."""
+
+from datetime import date
+
+from google.appengine.api import (
+    mail,
+    app_identity,
+    taskqueue,
+)
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+from google.appengine.runtime import DeadlineExceededError
+
+from models.game import Game
+
+REMINDER_BATCH_SIZE = 100
+REMINDER_TASK_URL = '/tasks/send_reminders'
+
+
+class ReminderRun(ndb.Model):
+    """Checkpoint of one day's reminder run, keyed by its ISO date"""
+    cursor = ndb.StringProperty(indexed=False)
+    batches = ndb.IntegerProperty(default=0, indexed=False)
+    sent = ndb.IntegerProperty(default=0, indexed=False)
+    done = ndb.BooleanProperty(default=False, indexed=False)
+
+
+@ndb.transactional
+def start_run():
+    """Starts today's run by enqueueing its first batch. Does nothing if the
+    run was already started."""
+    run_id = date.today().isoformat()
+    if ReminderRun.get_by_id(run_id):
+        return
+    ReminderRun(id=run_id).put()
+    taskqueue.add(url=REMINDER_TASK_URL, params={'run': run_id, 'batch': 0},
+                  transactional=True)
+
+
+def send_batch(run_id, batch):
+    """Sends the reminders of the next batch of users with active games and
+    checkpoints the run. If the request deadline hits part way through, the
+    run is checkpointed after the last user reminded.
+    Args:
+        run_id: The ISO date of the run.
+        batch: The number of the batch, which must be the next one of the run
+            so that a retried task cannot process a batch twice.
+    """
+    run = ReminderRun.get_by_id(run_id)
+    if not run or run.done or run.batches != batch:
+        return
+
+    # One result per user with active games, read from the index alone.
+    query = Game.query(Game.game_over == False,
+                       projection=[Game.user], distinct=True)
+    results = query.iter(limit=REMINDER_BATCH_SIZE, batch_size=REMINDER_BATCH_SIZE,
+                         produce_cursors=True,
+                         start_cursor=Cursor(urlsafe=run.cursor) if run.cursor else None)
+    user_keys = []
+    cursors = []
+    for game in results:
+        user_keys.append(game.user)
+        cursors.append(results.cursor_after())
+    if not user_keys:
+        _checkpoint(run.key, run.cursor, 0, True)
+        return
+
+    sender = 'noreply@{}.appspotmail.com'.format(app_identity.get_application_id())
+    processed = 0
+    sent = 0
+    try:
+        for user in ndb.get_multi(user_keys):
+            if user and user.email:
+                _send_reminder(sender, user)
+                sent += 1
+            processed += 1
+    except DeadlineExceededError:
+        if not processed:
+            raise
+        # Hand the rest of the batch to a fresh task.
+        _checkpoint(run.key, cursors[processed - 1].urlsafe(), sent, False)
+        return
+    _checkpoint(run.key, cursors[-1].urlsafe(), sent,
+                len(user_keys) < REMINDER_BATCH_SIZE)
+
+
+def _send_reminder(sender, user):
+    subject = 'This is a reminder!'
+    body = 'Hello {0}, This is a reminder that you have Hangman game in progress! ' \
+           'Let\'s play and have some fun!'\
+        .format(user.name)
+    # This will send emails to the users who have pending active games.
+    mail.send_mail(sender, user.email, subject, body)
+
+
+@ndb.transactional
+def _checkpoint(run_key, cursor, sent, done):
+    """Records the progress of a run and, unless it is done, enqueues its next
+    batch in the same transaction."""
+    run = run_key.get()
+    run.cursor = cursor
+    run.batches += 1
+    run.sent += sent
+    run.done = done
+    run.put()
+    if not done:
+        taskqueue.add(url=REMINDER_TASK_URL,
+                      params={'run': run_key.id(), 'batch': run.batches},
+                      transactional=True)
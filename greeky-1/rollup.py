@@ -0,0 +1,46 @@
+"""rollup.py - This file contains the periodic rollups of the running totals:
+the UserCounterShards onto the Users, so that the win_ratio get_user_rankings
+sorts by stays close to the exact counters, and the full recount behind the
+ActiveGamesShards. Each call of rollup_user_counters rolls up the users of
+one page of shards and returns the cursor of the next page so the task
+handlers in main.py can chain them."""
+
+from google.appengine.datastore.datastore_query import Cursor
+
+from models.aggregate import ActiveGamesShard, UserCounterShard
+from models.game import Game
+
+ROLLUP_BATCH_SIZE = 100
+
+
+def rollup_user_counters(urlsafe_cursor=None):
+    """Rolls up the users of one page of counter shards.
+    Args:
+        urlsafe_cursor: The cursor returned for the previous page, or None to
+            start from the first page.
+    Returns:
+        The urlsafe cursor of the next page, or None when done.
+    """
+    cursor = Cursor(urlsafe=urlsafe_cursor) if urlsafe_cursor else None
+    keys, next_cursor, more = UserCounterShard.query().fetch_page(
+            ROLLUP_BATCH_SIZE, keys_only=True, start_cursor=cursor)
+    user_names = set(UserCounterShard.user_name(key) for key in keys)
+    for user_name in user_names:
+        UserCounterShard.rollup(user_name)
+    # The totals do not change, but one read while a rollup committed may
+    # have cached a count missing its shards.
+    UserCounterShard.invalidate(user_names)
+    if not more or not next_cursor:
+        return None
+    return next_cursor.urlsafe()
+
+
+def reconcile_active_games():
+    """Recomputes the running totals of active Games with a full scan, to
+    correct any drift in the incrementally maintained shards."""
+    count = 0
+    total_attempts_remaining = 0
+    for game in Game.query(Game.game_over == False):
+        count += 1
+        total_attempts_remaining += game.attempts_remaining
+    ActiveGamesShard.reset(count, total_attempts_remaining)
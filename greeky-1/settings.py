@@ -2,3 +2,8 @@
 
 # client ID obtained from the APIs
 API_EXPLORER_CLIENT_ID = '792848817446-7n8cfgu65h63samdsuoqtae8dk2rm59b.apps.googleusercontent.com'
+
+# Days after their last move that finished games are archived.
+FINISHED_GAME_TTL_DAYS = 7
+# Days after their last move that active games are expired and archived.
+IDLE_GAME_TTL_DAYS = 30
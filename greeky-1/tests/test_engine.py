@@ -0,0 +1,158 @@
+"""test_engine.py - Unit tests of the game flow in engine/core.py, over the
+memory and SQLite repositories."""
+
+import copy
+import unittest
+
+from engine import rules
+from engine.core import HangmanEngine
+from engine.errors import (
+    BadRequestError,
+    ConflictError,
+    ForbiddenError,
+    NotFoundError,
+)
+from engine.memory import MemoryRepository
+from engine.sqlite import SqliteRepository
+
+
+class EngineTestMixin(object):
+    """The engine tests, run by a TestCase that sets self.engine."""
+
+    def setUp(self):
+        self.engine = HangmanEngine(self.repository())
+        self.engine.create_user(u'ann', u'ann@example.com')
+
+    def test_create_user_rejects_taken_name_and_email(self):
+        self.assertRaises(ConflictError, self.engine.create_user,
+                          u'ann', u'other@example.com')
+        self.assertRaises(ConflictError, self.engine.create_user,
+                          u'bob', u'ann@example.com')
+        self.assertRaises(BadRequestError, self.engine.create_user, u'', u'x')
+
+    def test_new_game(self):
+        game = self.engine.new_game(u'ann', u'banana', 3)
+        self.assertEqual(game.attempts_remaining, 3)
+        self.assertEqual(self.engine.get_game(game.id).answer, u'banana')
+        self.assertEqual(self.engine.get_average_attempts(), 3.0)
+        self.assertRaises(NotFoundError, self.engine.new_game, u'bob', u'banana')
+        self.assertRaises(BadRequestError, self.engine.new_game, u'ann', u'banana',
+                          rules.MAX_ATTEMPTS + 1)
+
+    def test_make_move(self):
+        game = self.engine.new_game(u'ann', u'banana', 3)
+        game, message = self.engine.make_move(game.id, u'z')
+        self.assertEqual(message, 'Wrong! You have 2 attempts remaining!')
+        self.engine.make_move(game.id, u'a')
+        game, message = self.engine.make_move(game.id, u'a')
+        self.assertEqual(message, 'You already got the letter a')
+        self.assertEqual(self.engine.get_game(game.id).attempts_remaining, 2)
+        self.assertEqual(self.engine.get_average_attempts(), 2.0)
+        self.assertRaises(BadRequestError, self.engine.make_move, game.id, u'zz')
+        self.assertRaises(NotFoundError, self.engine.make_move, 0, u'a')
+
+    def test_win_records_score_and_counts_game(self):
+        game = self.engine.new_game(u'ann', u'banana', 3)
+        game, results = self.engine.make_moves(game.id, [u'z', u'b', u'a', u'n', u'x'])
+        self.assertEqual([letter for letter, _ in results], [u'z', u'b', u'a', u'n'])
+        self.assertEqual(results[-1][1], 'You win!')
+        self.assertTrue(self.engine.get_game(game.id).game_over)
+        self.assertEqual(self.engine.make_move(game.id, u'x')[1], 'Game is over!')
+
+        scores = self.engine.get_user_scores(u'ann')
+        self.assertEqual([(score.won, score.attempts_used, score.attempts)
+                          for score in scores], [(True, 1, 3)])
+        self.assertEqual([score.user_name for score in
+                          self.engine.get_high_scores(10)], [u'ann'])
+        player = self.engine.repository.get_player(u'ann')
+        self.assertEqual((player.won, player.total_played, player.win_ratio),
+                         (1, 1, 1.0))
+        self.assertEqual([ranked.name for ranked in
+                          self.engine.get_user_rankings()], [u'ann'])
+        self.assertEqual(self.engine.get_user_games(u'ann'), [])
+        self.assertEqual(self.engine.get_average_attempts(), None)
+
+    def test_loss_counts_game(self):
+        game = self.engine.new_game(u'ann', u'banana', 1)
+        self.assertEqual(self.engine.make_move(game.id, u'z')[1],
+                         'Game Over, You lose!')
+        player = self.engine.repository.get_player(u'ann')
+        self.assertEqual((player.won, player.total_played), (0, 1))
+        self.assertRaises(NotFoundError, self.engine.get_high_scores, 10)
+        self.assertRaises(BadRequestError, self.engine.get_high_scores, 0)
+
+    def test_get_game_history(self):
+        game = self.engine.new_game(u'ann', u'banana')
+        self.engine.make_moves(game.id, [u'z', u'a', u'b'])
+        game, records = self.engine.get_game_history(game.id, 1, 1)
+        self.assertEqual(game.move_count, 3)
+        self.assertEqual([record[:2] for record in records], [(1, u'a')])
+        _, records = self.engine.get_game_history(game.id)
+        self.assertEqual(len(records), 3)
+        self.assertRaises(BadRequestError, self.engine.get_game_history, game.id, -1)
+        self.assertRaises(BadRequestError, self.engine.get_game_history, game.id, 0, 0)
+
+    def test_cancel_game(self):
+        game = self.engine.new_game(u'ann', u'banana', 1)
+        self.engine.cancel_game(game.id)
+        self.assertRaises(NotFoundError, self.engine.get_game, game.id)
+        self.assertEqual(self.engine.get_average_attempts(), None)
+
+        game = self.engine.new_game(u'ann', u'banana', 1)
+        self.engine.make_move(game.id, u'z')
+        self.assertRaises(ForbiddenError, self.engine.cancel_game, game.id)
+
+
+class StaleCacheRepository(MemoryRepository):
+    """MemoryRepository that returns copies of its games, whose cached reads
+    miss the game's last move, a miss, and whose saves of such stale copies
+    fail."""
+
+    def __init__(self):
+        super(StaleCacheRepository, self).__init__()
+        self.reads = []
+
+    def get_game(self, game_id, cached=True):
+        self.reads.append(cached)
+        game = copy.deepcopy(super(StaleCacheRepository, self).get_game(game_id))
+        if cached and game.moves:
+            game.attempts_remaining = game.moves.pop()[2] + 1
+        return game
+
+    def save_move(self, game, attempts_remaining, score=None):
+        stored = super(StaleCacheRepository, self).get_game(game.id)
+        if len(game.moves) != len(stored.moves) + 1:
+            raise ConflictError('The game was changed by another move.')
+        super(StaleCacheRepository, self).save_move(game, attempts_remaining, score)
+
+
+class StaleCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = StaleCacheRepository()
+        self.engine = HangmanEngine(self.repository)
+        self.engine.create_user(u'ann', u'ann@example.com')
+        game = self.engine.new_game(u'ann', u'banana', 3)
+        self.game_id = game.id
+        game.moves.append((u'z', rules.GUESS_MISS, 2))
+        game.attempts_remaining = 2
+
+    def test_move_retries_once_on_stored_game(self):
+        game, message = self.engine.make_move(self.game_id, u'x')
+        self.assertEqual(message, 'Wrong! You have 1 attempts remaining!')
+        self.assertEqual(self.repository.reads, [True, False])
+        self.assertEqual([move[0] for move in game.moves], [u'z', u'x'])
+
+
+class MemoryEngineTest(EngineTestMixin, unittest.TestCase):
+
+    repository = MemoryRepository
+
+
+class SqliteEngineTest(EngineTestMixin, unittest.TestCase):
+
+    repository = SqliteRepository
+
+
+if __name__ == '__main__':
+    unittest.main()
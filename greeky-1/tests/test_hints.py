@@ -0,0 +1,71 @@
+"""test_hints.py - Unit tests of the hint solver in hints.py. The solver needs
+NumPy, and its candidate cache the App Engine SDK on the path."""
+
+import unittest
+
+import wordbank
+
+try:
+    import hints
+except ImportError:
+    hints = None
+
+WORDS = ['cat', 'cot', 'cut', 'dog', 'fig', 'bake', 'cake', 'lake', 'lime',
+         'make', 'ring']
+
+
+@unittest.skipIf(hints is None, 'needs NumPy and the App Engine SDK')
+class SolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = wordbank.WordBank(wordbank.build(WORDS))
+        self.solver = hints.Solver(self.bank)
+
+    def matches(self, pattern, guessed):
+        words = list(self.bank.words(len(pattern)))
+        return sorted(words[i] for i in self.solver.candidates(pattern, guessed))
+
+    def test_candidates_of_blank_pattern(self):
+        self.assertEqual(self.matches([u''] * 3, ''), ['cat', 'cot', 'cut', 'dog', 'fig'])
+        self.assertEqual(self.matches([u''] * 6, ''), [])
+
+    def test_candidates_match_revealed_letters(self):
+        self.assertEqual(self.matches([u'', u'a', u'k', u'e'], 'ake'),
+                         ['bake', 'cake', 'lake', 'make'])
+        self.assertEqual(self.matches([u'c', u'', u't'], 'ct'), ['cat', 'cot', 'cut'])
+
+    def test_candidates_exclude_guessed_letters(self):
+        # A miss rules out every word with the letter, and a hit rules out
+        # the words with it at a hidden position.
+        self.assertEqual(self.matches([u''] * 3, 'o'), ['cat', 'cut', 'fig'])
+        self.assertEqual(self.matches([u'', u'a', u'k', u'e'], 'akeb'),
+                         ['cake', 'lake', 'make'])
+
+    def test_candidates_of_letters_outside_the_alphabet(self):
+        self.assertEqual(self.matches([u'\xe9', u'', u''], u'\xe9'), [])
+
+    def test_candidates_are_cached(self):
+        first = self.solver.candidates([u''] * 3, 'a')
+        self.assertIs(self.solver.candidates([u''] * 3, 'aa'), first)
+
+    def test_hint_splits_the_candidates(self):
+        letter, candidates = self.solver.hint([u'c', u'', u't'], 'ct')
+        self.assertIn(letter, 'aou')
+        self.assertEqual(candidates, 3)
+
+    def test_hint_skips_guessed_letters(self):
+        letter, candidates = self.solver.hint([u''] * 4, '')
+        self.assertEqual(candidates, 6)
+        self.assertNotEqual(self.solver.hint([u''] * 4, letter)[0], letter)
+
+    def test_hint_without_candidates(self):
+        self.assertEqual(self.solver.hint([u'z', u'', u''], 'z'), (None, 0))
+
+    def test_hint_when_only_one_word_is_left(self):
+        letter, candidates = self.solver.hint([u'd', u'', u'g'], 'dgaeiu')
+        self.assertEqual(candidates, 1)
+        self.assertEqual(letter, 'o')
+
+
+if __name__ == '__main__':
+    unittest.main()
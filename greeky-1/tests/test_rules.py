@@ -0,0 +1,176 @@
+"""test_rules.py - Unit tests of the game rules in engine/rules.py."""
+
+import struct
+import unittest
+
+from engine import rules
+
+
+class FakeGame(object):
+    """A plain game object with the attributes the rules operate on."""
+
+    def __init__(self, answer=u'banana', attempts=None):
+        self.moves = []
+        rules.start_game(self, answer, attempts)
+
+    def history(self):
+        return self.moves
+
+
+class FakePlayer(object):
+
+    def __init__(self, won=0, total_played=0):
+        self.won = won
+        self.total_played = total_played
+        self.win_ratio = rules.win_ratio(won, total_played)
+
+
+class StartGameTest(unittest.TestCase):
+
+    def test_defaults_attempts(self):
+        game = FakeGame(attempts=None)
+        self.assertEqual(game.attempts, rules.DEFAULT_ATTEMPTS)
+        self.assertEqual(game.attempts_remaining, rules.DEFAULT_ATTEMPTS)
+        self.assertFalse(game.game_over)
+
+    def test_indexes_answer(self):
+        game = FakeGame(u'banana')
+        self.assertEqual(game.letter_positions,
+                         {u'b': 0b000001, u'a': 0b101010, u'n': 0b010100})
+        self.assertEqual(game.revealed, 0)
+        self.assertEqual(game.letters_remaining, 6)
+
+    def test_rejects_attempts_out_of_range(self):
+        for attempts in (0, -1, rules.MAX_ATTEMPTS + 1):
+            self.assertRaises(ValueError, FakeGame, u'word', attempts)
+
+    def test_accepts_max_attempts(self):
+        game = FakeGame(u'word', rules.MAX_ATTEMPTS)
+        self.assertEqual(game.attempts_remaining, rules.MAX_ATTEMPTS)
+
+    def test_index_answer_keeps_revealed_letters(self):
+        game = FakeGame(u'banana')
+        rules.index_answer(game, [u'', u'a', u'', u'a', u'', u'a'])
+        self.assertEqual(game.revealed, 0b101010)
+        self.assertEqual(game.letters_remaining, 3)
+
+
+class MoveTest(unittest.TestCase):
+
+    def test_miss_spends_an_attempt(self):
+        game = FakeGame(u'banana', 3)
+        self.assertEqual(rules.apply_move(game, u'z'), rules.GUESS_MISS)
+        self.assertEqual(game.attempts_remaining, 2)
+        self.assertEqual(game.moves, [(u'z', rules.GUESS_MISS, 2)])
+
+    def test_hit_reveals_every_position(self):
+        game = FakeGame(u'banana')
+        self.assertEqual(rules.apply_move(game, u'a'), rules.GUESS_HIT)
+        self.assertEqual(rules.reveal(game.answer, game.revealed),
+                         [u'', u'a', u'', u'a', u'', u'a'])
+        self.assertEqual(game.letters_remaining, 3)
+        self.assertEqual(game.attempts_remaining, rules.DEFAULT_ATTEMPTS)
+
+    def test_repeat_changes_nothing(self):
+        game = FakeGame(u'banana')
+        rules.apply_move(game, u'a')
+        self.assertEqual(rules.apply_move(game, u'a'), rules.GUESS_REPEAT)
+        self.assertEqual(len(game.moves), 1)
+        self.assertEqual(game.letters_remaining, 3)
+
+    def test_last_hit_wins(self):
+        game = FakeGame(u'banana')
+        results = [rules.apply_move(game, letter) for letter in u'ban']
+        self.assertEqual(results, [rules.GUESS_HIT, rules.GUESS_HIT,
+                                   rules.GUESS_WIN])
+        self.assertEqual(game.letters_remaining, 0)
+
+    def test_last_miss_loses(self):
+        game = FakeGame(u'banana', 2)
+        rules.apply_move(game, u'x')
+        self.assertEqual(rules.apply_move(game, u'y'), rules.GUESS_LOSE)
+        self.assertEqual(game.moves[-1], (u'y', rules.GUESS_LOSE, 0))
+
+    def test_answer_longer_than_64_letters(self):
+        answer = u'ab' * 40
+        game = FakeGame(answer)
+        self.assertEqual(rules.apply_move(game, u'a'), rules.GUESS_HIT)
+        self.assertTrue(game.revealed >= 1 << 63)
+        self.assertEqual(rules.apply_move(game, u'b'), rules.GUESS_WIN)
+        self.assertEqual(u''.join(rules.reveal(answer, game.revealed)), answer)
+
+    def test_is_valid_move(self):
+        for move in (u'a', u'Z', u'\xe9'):
+            self.assertTrue(rules.is_valid_move(move), move)
+        for move in (None, u'', u'ab', u'1', u'?', u'\U0001d400'):
+            self.assertFalse(rules.is_valid_move(move), repr(move))
+
+
+class EndGameTest(unittest.TestCase):
+
+    def test_end_game(self):
+        game = FakeGame(u'banana')
+        rules.apply_move(game, u'z')
+        self.assertEqual(rules.end_game(game, True), 1)
+        self.assertTrue(game.game_over)
+
+    def test_win_updates_counters(self):
+        player = FakePlayer(won=1, total_played=2)
+        rules.add_result(player, True)
+        self.assertEqual((player.won, player.total_played), (2, 3))
+        self.assertEqual(player.win_ratio, 0.67)
+
+    def test_loss_updates_counters(self):
+        player = FakePlayer()
+        rules.add_result(player, False)
+        self.assertEqual((player.won, player.total_played), (0, 1))
+        self.assertEqual(player.win_ratio, 0.0)
+
+    def test_win_ratio_without_games(self):
+        self.assertEqual(rules.win_ratio(0, 0), 0.0)
+
+    def test_ranks(self):
+        scores = [(3, 6), (2, 6), (2, 10)]
+        self.assertEqual(sorted(scores, key=lambda score: rules.score_rank(*score)),
+                         [(2, 10), (2, 6), (3, 6)])
+        players = [FakePlayer(1, 2), FakePlayer(2, 4), FakePlayer(3, 4)]
+        self.assertEqual([(player.won, player.total_played) for player
+                          in sorted(players, key=rules.player_rank)],
+                         [(3, 4), (1, 2), (2, 4)])
+
+
+class HistoryTest(unittest.TestCase):
+
+    def test_move_message(self):
+        self.assertEqual(rules.move_message(rules.GUESS_MISS, 4, []),
+                         'Wrong! You have 4 attempts remaining!')
+        self.assertEqual(rules.move_message(rules.GUESS_LOSE, 0, []),
+                         'Game Over, You lose!')
+        self.assertEqual(rules.move_message(rules.GUESS_WIN, 4, []), 'You win!')
+        self.assertEqual(rules.move_message(rules.GUESS_HIT, 4, [u'a', u'']),
+                         "Correct! You got [u'a', u'']")
+
+    def test_replay_moves(self):
+        game = FakeGame(u'banana')
+        for letter in u'zab':
+            rules.apply_move(game, letter)
+        records = rules.replay_moves(game, game.moves, 0, 0, 1, 3)
+        self.assertEqual([record[:2] for record in records], [(1, u'a'), (2, u'b')])
+        self.assertEqual(records[1][2], rules.move_message(
+                rules.GUESS_HIT, 5, [u'b', u'a', u'', u'a', u'', u'a']))
+        self.assertEqual(records[1][3], 5)
+
+    def test_pack_round_trip(self):
+        moves = [(u'a', rules.GUESS_HIT, 6), (u'\xe9', rules.GUESS_MISS, 5),
+                 (u'\uffff', rules.GUESS_LOSE, rules.MAX_ATTEMPTS)]
+        data = rules.pack_moves(moves)
+        self.assertEqual(len(data), len(moves) * rules.MOVE_RECORD.size)
+        self.assertEqual(rules.unpack_moves(data), moves)
+
+    def test_pack_rejects_attempts_over_record(self):
+        self.assertRaises(struct.error, rules.pack_moves,
+                          [(u'a', rules.GUESS_MISS, rules.MAX_ATTEMPTS + 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
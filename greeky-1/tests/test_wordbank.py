@@ -0,0 +1,91 @@
+"""test_wordbank.py - Unit tests of the word bank file format in wordbank.py."""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import wordbank
+
+WORDS = ['cat', 'dog', 'zoo', 'fizz', 'tree', 'jazz', 'seen', 'queue',
+         'apple', 'crypt', 'cat', 'Bad', 'no', 'x1y', 'caf\xc3\xa9']
+
+
+class BuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bank = wordbank.WordBank(wordbank.build(WORDS))
+
+    def test_skips_invalid_and_duplicate_words(self):
+        self.assertEqual(len(self.bank), 10)
+        self.assertEqual(sorted(self.bank.words()),
+                         sorted(set(WORDS[:10])))
+
+    def test_lengths(self):
+        self.assertEqual(self.bank.lengths(), [3, 4, 5])
+        self.assertEqual(self.bank.count(3), 3)
+        self.assertEqual(self.bank.count(4), 4)
+        self.assertEqual(self.bank.count(6), 0)
+
+    def test_difficulties_split_each_length(self):
+        for length in self.bank.lengths():
+            counts = [self.bank.count(length, difficulty)
+                      for difficulty in range(len(wordbank.DIFFICULTIES))]
+            self.assertEqual(sum(counts), self.bank.count(length))
+            self.assertTrue(max(counts) - min(counts) <= 1, counts)
+
+    def test_easy_words_score_higher(self):
+        easy = self.bank.words(4, 0).next()
+        hard = self.bank.words(4, 2).next()
+        self.assertTrue(wordbank.difficulty_score(easy) >
+                        wordbank.difficulty_score(hard))
+
+    def test_choose(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            word = self.bank.choose(5, rng=rng)
+            self.assertIn(word, ('queue', 'apple', 'crypt'))
+            self.assertTrue(isinstance(word, unicode))
+        self.assertIn(self.bank.choose(4, 2, rng), list(self.bank.words(4, 2)))
+        self.assertIsNone(self.bank.choose(9))
+
+    def test_choose_covers_every_word(self):
+        rng = random.Random(2)
+        chosen = set(self.bank.choose(rng=rng) for _ in range(500))
+        self.assertEqual(chosen, set(self.bank.words()))
+
+    def test_packed(self):
+        packed = self.bank.packed(4)
+        self.assertEqual(packed, ''.join(self.bank.words(4)))
+        self.assertEqual(self.bank.packed(9), '')
+
+    def test_rejects_other_files(self):
+        self.assertRaises(ValueError, wordbank.WordBank, 'HWB0\x00\x00')
+
+
+class LoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_load(self):
+        path = os.path.join(self.directory, 'words.bin')
+        with open(path, 'wb') as bank_file:
+            bank_file.write(wordbank.build(WORDS))
+        bank = wordbank.load(path)
+        self.assertEqual(sorted(bank.words()), sorted(set(WORDS[:10])))
+
+    def test_application_bank(self):
+        bank = wordbank.get()
+        self.assertTrue(len(bank))
+        for length in bank.lengths():
+            self.assertTrue(wordbank.MIN_WORD_LENGTH <= length <=
+                            wordbank.MAX_WORD_LENGTH)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,27 @@
 """utils.py - File for collecting general utility functions."""
 
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.api import datastore_errors
 from google.appengine.ext import ndb
 import endpoints
 
+import cache
 
-def get_by_urlsafe(urlsafe, model):
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def get_by_urlsafe(urlsafe, model, cached=True):
     """Returns an ndb.Model entity that the urlsafe key points to. Checks
         that the type of entity returned is of the correct kind. Raises an
         error if the key String is malformed or the entity is of the incorrect
-        kind
+        kind. Models with _use_entity_cache set are read through the two-tier
+        entity cache, unless cached is False
     Args:
         urlsafe: A urlsafe key string
         model: The expected entity kind
+        cached: False to read the stored entity, for callers retrying a
+            write that found their cached copy was older than it.
     Returns:
         The entity that the urlsafe Key string points to or None if no entity
         exists.
@@ -27,9 +37,53 @@ def get_by_urlsafe(urlsafe, model):
         else:
             raise
 
-    entity = key.get()
-    if not entity:
-        return None
+    use_cache = cached and getattr(model, '_use_entity_cache', False)
+    entity = cache.get(key.urlsafe()) if use_cache else None
+    if entity is None:
+        entity = key.get()
+        if not entity:
+            return None
+        if use_cache:
+            cache.set(entity)
     if not isinstance(entity, model):
         raise ValueError('Incorrect Kind')
     return entity
+
+
+def fetch_page(query, page_size, urlsafe_cursor):
+    """Fetches one page of results of a query, starting at an opaque cursor
+        returned by a previous page.
+    Args:
+        query: The ndb.Query to page through.
+        page_size: The number of results wanted, DEFAULT_PAGE_SIZE when None.
+            Capped at MAX_PAGE_SIZE.
+        urlsafe_cursor: The urlsafe cursor of the previous page, or None for
+            the first page.
+    Returns:
+        A tuple of the results and the urlsafe cursor of the next page, which
+        is None when there are no more results.
+    Raises:
+        endpoints.BadRequestException: If the page size is not positive or the
+            cursor is malformed."""
+    return fetch_page_async(query, page_size, urlsafe_cursor).get_result()
+
+
+@ndb.tasklet
+def fetch_page_async(query, page_size, urlsafe_cursor):
+    """Like fetch_page, but returns a Future of the page, so that the query
+        runs while the caller issues other RPCs. Errors are raised by the
+        Future's get_result."""
+    if page_size is None:
+        page_size = DEFAULT_PAGE_SIZE
+    elif page_size <= 0:
+        raise endpoints.BadRequestException('Page size must be greater than 0!')
+    try:
+        cursor = Cursor(urlsafe=urlsafe_cursor) if urlsafe_cursor else None
+    except datastore_errors.BadValueError:
+        raise endpoints.BadRequestException('Invalid cursor')
+
+    results, next_cursor, more = yield query.fetch_page_async(
+            min(page_size, MAX_PAGE_SIZE), start_cursor=cursor)
+    if not more or not next_cursor:
+        raise ndb.Return((results, None))
+    raise ndb.Return((results, next_cursor.urlsafe()))
@@ -0,0 +1,61 @@
+"""warmup.py - This file contains the instance warmup, run by /_ah/warmup
+before App Engine sends a new instance traffic. It imports the API and primes
+the caches its hot endpoints read, so the first requests an instance serves
+skip the cold start, and records how long each step took in the metrics
+served by /admin/metrics."""
+
+import collections
+import logging
+import os
+import time
+
+import instrumentation
+
+
+def warm_up():
+    """Imports the API and primes the leaderboard, the active games totals
+    and the word bank. A step that fails is logged and skipped.
+    Returns:
+        dict: The milliseconds taken by each of instrumentation.STARTUP_STEPS.
+    """
+    start = time.time()
+    timings = collections.OrderedDict()
+    for step, prime in (('import_api', _import_api),
+                        ('leaderboard', _prime_leaderboard),
+                        ('average_attempts', _prime_average_attempts),
+                        ('word_bank', _prime_word_bank)):
+        step_start = time.time()
+        try:
+            prime()
+        except Exception:
+            logging.exception('Warmup step %s failed', step)
+        timings[step] = (time.time() - step_start) * 1000
+    timings['total'] = (time.time() - start) * 1000
+
+    logging.info('Instance warmed up in %dms (%s)', timings['total'],
+                 ', '.join('{} {:.0f}ms'.format(step, ms)
+                           for step, ms in timings.iteritems() if step != 'total'))
+    instrumentation.record_startup(timings)
+    return timings
+
+
+def _import_api():
+    # Loads endpoints, the models and the API's helpers for the SPI script,
+    # which shares this instance's modules.
+    import api
+
+
+def _prime_leaderboard():
+    from models.leaderboard import Leaderboard
+    Leaderboard.top()
+
+
+def _prime_average_attempts():
+    from models.aggregate import ActiveGamesShard
+    ActiveGamesShard.average()
+
+
+def _prime_word_bank():
+    import wordbank
+    if os.path.exists(wordbank.WORD_BANK_PATH):
+        wordbank.get()
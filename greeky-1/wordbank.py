@@ -0,0 +1,212 @@
+"""wordbank.py - This file contains the server-side word bank that new games
+draw their answers from when the client does not supply one.
+
+The bank is a compact binary file, memory-mapped on first use where the
+runtime allows it and read whole otherwise. Its words are grouped into
+buckets by length and difficulty, each a run of fixed-width words, so a word
+is picked by offset arithmetic without scanning the list.
+
+File layout, little-endian:
+    header: magic 'HWB1', bucket count (uint16)
+    bucket table: length (uint8), difficulty (uint8), offset (uint32) and
+        count (uint32) of each bucket
+    words: the lowercase ASCII words of each bucket, back to back
+
+Build the file from a word list with:
+    python wordbank.py data/words.txt data/words.bin
+"""
+
+import os
+import random
+import struct
+import sys
+import threading
+
+WORD_BANK_PATH = os.path.join(os.path.dirname(__file__), 'data', 'words.bin')
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+MAGIC = 'HWB1'
+HEADER = struct.Struct('<4sH')
+BUCKET = struct.Struct('<BBII')
+
+MIN_WORD_LENGTH = 3
+MAX_WORD_LENGTH = 32
+
+# Relative frequencies of the letters in English text, in percent. Words made
+# of rarer letters are harder to guess.
+LETTER_FREQUENCIES = {
+    'e': 12.70, 't': 9.06, 'a': 8.17, 'o': 7.51, 'i': 6.97, 'n': 6.75,
+    's': 6.33, 'h': 6.09, 'r': 5.99, 'd': 4.25, 'l': 4.03, 'c': 2.78,
+    'u': 2.76, 'm': 2.41, 'w': 2.36, 'f': 2.23, 'g': 2.02, 'y': 1.97,
+    'p': 1.93, 'b': 1.29, 'v': 0.98, 'k': 0.77, 'j': 0.15, 'x': 0.15,
+    'q': 0.10, 'z': 0.07,
+}
+
+_bank = []
+_bank_lock = threading.Lock()
+
+
+class WordBank(object):
+    """A read-only word bank over the bytes of a word bank file."""
+
+    def __init__(self, data):
+        """Parses the bucket table of a word bank file.
+        Args:
+            data: The file contents, as a string or an mmap.
+        Raises:
+            ValueError: If data is not a word bank file.
+        """
+        magic, buckets = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a word bank file.')
+        self._data = data
+        # (length, difficulty, offset, count) of each bucket, in file order.
+        self._buckets = [BUCKET.unpack_from(data, HEADER.size + i * BUCKET.size)
+                         for i in range(buckets)]
+
+    def __len__(self):
+        return sum(bucket[3] for bucket in self._buckets)
+
+    def lengths(self):
+        """Returns the sorted word lengths in the bank."""
+        return sorted(set(bucket[0] for bucket in self._buckets))
+
+    def count(self, length=None, difficulty=None):
+        """Returns the number of words of a length and difficulty, either of
+        which may be None to match any."""
+        return sum(count for _, _, count in self._matching(length, difficulty))
+
+    def choose(self, length=None, difficulty=None, rng=random):
+        """Picks a word uniformly among those of a length and difficulty.
+        Args:
+            length: The length of the word, or None for any length.
+            difficulty: The index in DIFFICULTIES of the word's difficulty, or
+                None for any difficulty.
+            rng: The random number generator to use.
+        Returns:
+            The word as a unicode string, or None if no word matches.
+        """
+        buckets = self._matching(length, difficulty)
+        total = sum(count for _, _, count in buckets)
+        if not total:
+            return None
+        i = rng.randrange(total)
+        for word_length, offset, count in buckets:
+            if i < count:
+                start = offset + i * word_length
+                return self._data[start:start + word_length].decode('ascii')
+            i -= count
+
+    def words(self, length=None, difficulty=None):
+        """Yields the words of a length and difficulty, either of which may
+        be None to match any."""
+        for word_length, offset, count in self._matching(length, difficulty):
+            for i in xrange(count):
+                start = offset + i * word_length
+                yield self._data[start:start + word_length].decode('ascii')
+
+    def packed(self, length):
+        """Returns the words of a length as one string of back to back
+        fixed-width words, in the order of words(length). The buckets of a
+        length are contiguous in the file, so this is a single slice."""
+        buckets = self._matching(length, None)
+        if not buckets:
+            return ''
+        start = buckets[0][1]
+        return self._data[start:start + length * sum(count for _, _, count in buckets)]
+
+    def _matching(self, length, difficulty):
+        """Returns (length, offset, count) of the matching buckets."""
+        return [(bucket_length, offset, count)
+                for bucket_length, bucket_difficulty, offset, count in self._buckets
+                if length in (None, bucket_length) and
+                difficulty in (None, bucket_difficulty)]
+
+
+def get():
+    """Returns the word bank of the application, loading it on first use."""
+    if not _bank:
+        with _bank_lock:
+            if not _bank:
+                _bank.append(load(WORD_BANK_PATH))
+    return _bank[0]
+
+
+def load(path):
+    """Opens a word bank file, memory-mapped when mmap is available.
+    Args:
+        path: The path of the word bank file.
+    Returns:
+        WordBank: The word bank.
+    """
+    with open(path, 'rb') as bank_file:
+        try:
+            import mmap
+            data = mmap.mmap(bank_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ImportError, EnvironmentError, ValueError):
+            # The App Engine sandbox has no mmap; the file is small enough to
+            # read whole.
+            data = bank_file.read()
+    return WordBank(data)
+
+
+def difficulty_score(word):
+    """Returns the average English frequency of the distinct letters of a
+    word. The lower the score, the harder the word is to guess."""
+    letters = set(word)
+    return sum(LETTER_FREQUENCIES[letter] for letter in letters) / len(letters)
+
+
+def build(words):
+    """Builds the contents of a word bank file.
+    Words are deduplicated and split into DIFFICULTIES by terciles of their
+    difficulty_score within each length.
+    Args:
+        words: An iterable of words. Words that are not MIN_WORD_LENGTH to
+            MAX_WORD_LENGTH lowercase ASCII letters are skipped.
+    Returns:
+        The file contents as a string.
+    """
+    by_length = {}
+    for word in set(words):
+        if (MIN_WORD_LENGTH <= len(word) <= MAX_WORD_LENGTH and
+                word.isalpha() and word.islower() and
+                all(letter in LETTER_FREQUENCIES for letter in word)):
+            by_length.setdefault(len(word), []).append(str(word))
+
+    buckets = []
+    for length, bucket_words in sorted(by_length.iteritems()):
+        # Easiest first, ties in alphabetical order.
+        bucket_words.sort(key=lambda word: (-difficulty_score(word), word))
+        size = len(bucket_words)
+        for difficulty in range(len(DIFFICULTIES)):
+            chunk = bucket_words[difficulty * size // len(DIFFICULTIES):
+                                 (difficulty + 1) * size // len(DIFFICULTIES)]
+            if chunk:
+                buckets.append((length, difficulty, sorted(chunk)))
+
+    offset = HEADER.size + len(buckets) * BUCKET.size
+    table = [HEADER.pack(MAGIC, len(buckets))]
+    for length, difficulty, chunk in buckets:
+        table.append(BUCKET.pack(length, difficulty, offset, len(chunk)))
+        offset += length * len(chunk)
+    return ''.join(table) + ''.join(''.join(chunk) for _, _, chunk in buckets)
+
+
+def main(argv):
+    if len(argv) != 3:
+        sys.exit('Usage: python wordbank.py WORD_LIST OUTPUT')
+    with open(argv[1]) as word_list:
+        words = [line.strip() for line in word_list
+                 if line.strip() and not line.startswith('#')]
+    data = build(words)
+    with open(argv[2], 'wb') as output:
+        output.write(data)
+    bank = WordBank(data)
+    print('{} words of lengths {} written to {}'.format(
+            len(bank), ', '.join(str(length) for length in bank.lengths()), argv[2]))
+
+
+if __name__ == '__main__':
+    main(sys.argv)